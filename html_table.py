@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
+import argparse
 import collections.abc
+import functools
 import logging
 import math
+import pathlib
+import sys
+import tempfile
+import types
+import weakref
 from typing import Any, Union, Optional, Callable, Sequence, Mapping, Generator, Iterable, Dict, List, Tuple, Set, cast
 try:
   from IPython.display import HTML
@@ -14,42 +21,99 @@ RawStyle = Union['Style',Dict[str,Any]]
 
 DEFAULT_HEADER_STYLE = {'bold':True}
 BORDER_STYLE = '1px solid black'
+# Shared stand-ins for empty `borders` and `css`, so default-styled cells don't each allocate their
+# own empty containers. `Style` swaps them out for private mutable ones on first access.
+EMPTY_BORDERS: frozenset = frozenset()
+EMPTY_CSS: Mapping[str,Any] = types.MappingProxyType({})
+# Pre-built span attributes for the sizes that actually come up.
+COLSPAN_ATTRS = {i:sys.intern(f'colspan={i}') for i in range(2, 33)}
+ROWSPAN_ATTRS = {i:sys.intern(f'rowspan={i}') for i in range(2, 33)}
+# Incremented whenever anything in any table changes (see `note_change()`), to invalidate the
+# cached `Table.width` and rendered header sections.
+CHANGE_VERSION = 0
+# Pool of shared `Style`s from `Style.make()`, keyed on `Style.get_key()` (which includes the types
+# of the values, so `bold=1` and `bold=True` get different `Style`s).
+STYLE_POOL: 'weakref.WeakValueDictionary[Tuple,Style]' = weakref.WeakValueDictionary()
+# Cache of rendered `style` attributes, keyed on `Style.get_key()`.
+STYLE_STRS: Dict[Tuple,Tuple[str,str]] = {}
+MAX_STYLE_STRS = 4096
+# Cache of `str.format` templates for rendering `<tr>`s, keyed on the shape of the row.
+ROW_TEMPLATES: Dict[Tuple,str] = {}
+MAX_ROW_TEMPLATES = 1024
+
+
+class TrackedDict(dict):
+  """A `dict` which calls `note_change()` whenever it's modified.
+  Used for `Style.css`, which is handed out to be modified in place."""
+  __slots__ = ()
+
+
+class TrackedSet(set):
+  """A `set` which calls `note_change()` whenever it's modified. Used for `Style.borders`."""
+  __slots__ = ()
+
+  def __repr__(self) -> str:
+    return repr(set(self))
 
 
 class Styled:
 
+  __slots__ = ()
+
+  def to_html(self, indents=0, indent='  ') -> str:
+    # All the layers write their fragments into one shared list, joined once at the end.
+    out: List[str] = []
+    self._write_html(out, indents=indents, indent=indent)
+    return ''.join(out)
+
   def init_style(self, kwargs: Dict[str,Any]) -> Set[str]:
     unused = set()
     style_kwargs = {}
     for key, value in kwargs.items():
-      if key in Style.METADATA:
+      if key in STYLE_ATTRS:
         style_kwargs[key] = value
       else:
         unused.add(key)
-    self.style = style_kwargs
+    if style_kwargs:
+      self.style = style_kwargs
+    else:
+      # Most objects never get any style settings, so they can all share one read-only default
+      # (it gets copied if anything is set later).
+      self._style = DEFAULT_STYLE
     return unused
 
-  def __getattr__(self, attr: str) -> Any:
-    if attr in Style.METADATA:
-      return getattr(self.style, attr)
-    else:
-      object.__getattribute__(self, attr)
+  # The attributes in `Style.METADATA` are forwarded to `self.style` by properties added to this
+  # class after `Style` is defined (see `style_property()`).
 
   def __setattr__(self, attr: str, value: Any):
-    if attr == 'style':
-      if isinstance(value, Style):
-        object.__setattr__(self, 'style', value)
-      elif isinstance(value, collections.abc.Mapping):
-        object.__setattr__(self, 'style', Style(**value))
-      else:
-        raise ValueError(f"'style' attribute can only be set to a Style object or a mapping.")
-    elif attr in Style.METADATA:
-      setattr(self.style, attr, value)
+    # Plain slot assignment, plus a record of the change for the render caches.
+    object.__setattr__(self, attr, value)
+    note_change()
+
+  @property
+  def style(self) -> 'Style':
+    # Copy-on-write: the `Style` in `_style` may be shared with other objects (see `Style.make()`),
+    # so swap in a private copy before handing it out to be modified. Code which only reads the
+    # style should use `_style` directly.
+    style = self._style
+    if style._shared:
+      style = self._style = style.copy()
+    return style
+
+  @style.setter
+  def style(self, value: RawStyle) -> None:
+    if isinstance(value, Style):
+      self._style = value
+    elif isinstance(value, collections.abc.Mapping):
+      self._style = Style(**value)
     else:
-      object.__setattr__(self, attr, value)
+      raise ValueError(f"'style' attribute can only be set to a Style object or a mapping.")
 
 
 class Table(Styled):
+
+  __slots__ = ('_header', '_body', '_style', '_width_cache', '_html_cache')
+
   def __init__(self, body: RawRows=None, header: RawRows=None, header_len: int=None,
     header_style: RawStyle=None, **kwargs: Mapping[str,Any]
   ):
@@ -80,6 +144,8 @@ class Table(Styled):
     `header_len` can be used to divide a single `body` into header and body sections. Give the
     number of rows of the `body` that should be removed and stored in the `header`.
     """.format(BORDER_STYLE, DEFAULT_HEADER_STYLE)
+    self._width_cache: Optional[Tuple[int,Optional[int]]] = None
+    self._html_cache: Optional[Tuple[Tuple,str]] = None
     if header_style is None:
       header_style = DEFAULT_HEADER_STYLE.copy()
     if header is None and header_len is not None and body is not None:
@@ -124,13 +190,18 @@ class Table(Styled):
     #TODO: This is not always accurate, even with a table that appears to have equal width rows.
     #      In such a table, if a cell has a rowspan > 1, the following row will have a smaller
     #      total colspan, since the cell in the row above takes the place of one of its cells.
+    # The result is cached until something changes in any table (see `note_change()`).
+    if self._width_cache is not None and self._width_cache[0] == CHANGE_VERSION:
+      return self._width_cache[1]
     try:
       row = self[0]
     except IndexError:
-      return None
-    width = 0
-    for cell in row:
-      width += cell.width
+      width = None
+    else:
+      width = 0
+      for cell in row:
+        width += cell.width
+    object.__setattr__(self, '_width_cache', (CHANGE_VERSION, width))
     return width
 
   @property
@@ -159,10 +230,7 @@ class Table(Styled):
       arg_strs.append(repr(self.body))
     if self.header:
       arg_strs.append(f'header={self.header!r}')
-    for attr, metadata in Style.METADATA.items():
-      value = getattr(self, attr)
-      if value != metadata['default']:
-        arg_strs.append(f'{attr}={value!r}')
+    arg_strs.extend(self._style.get_nondefault_strs())
     return f'{class_name}('+', '.join(arg_strs)+')'
 
   def to_text(self, delim='\t', row_delim='\n') -> str:
@@ -172,16 +240,19 @@ class Table(Styled):
         sections.append(section.to_text(delim=delim, row_delim=row_delim))
     return row_delim.join(sections)
 
-  def to_html(self, indents=0, indent='  ') -> str:
-    html_lines = []
-    attr_str = self.style.to_attr_str()
-    html_lines.append(indent*indents+f'<table{attr_str}>')
-    if self.header:
-      html_lines.append(self.header.to_html(indents=(indents+1), indent=indent))
-    if self.body:
-      html_lines.append(self.body.to_html(indents=(indents+1), indent=indent))
-    html_lines.append(indent*indents+'</table>')
-    return '\n'.join(html_lines)
+  def _write_html(self, out: List[str], indents=0, indent='  ') -> None:
+    # Tables often get re-rendered without changes (e.g. re-displaying them in a notebook), so keep
+    # the last rendering until something changes in any table (see `note_change()`).
+    # Note: like the `Rows` cache, this can't detect in-place modifications of the cells' `value`s.
+    key = (CHANGE_VERSION, indents, indent)
+    if self._html_cache is not None and self._html_cache[0] == key:
+      out.append(self._html_cache[1])
+      return
+    table_out: List[str] = []
+    write_table_html(self, table_out, indents=indents, indent=indent)
+    html = ''.join(table_out)
+    object.__setattr__(self, '_html_cache', (key, html))
+    out.append(html)
 
   def deep_apply(self, **kwargs: Mapping[str,Any]) -> None:
     """Apply styles directly to every Cell."""
@@ -195,6 +266,7 @@ class Table(Styled):
     elif direction == 'right':
       max_len = max(len(self), len(other))
       orig_width = self.width
+      other_width = other.width
       for i in range(max_len):
         try:
           row = self[i]
@@ -204,7 +276,7 @@ class Table(Styled):
         try:
           other_row = other[i]
         except IndexError:
-          other_row = Row([None] * other.width)
+          other_row = Row([None] * other_width)
         row.extend(other_row)
 
   def render(self) -> HTML:
@@ -348,6 +420,8 @@ class Table(Styled):
 
 class ListLike:
 
+  __slots__ = ('_items', 'item_type')
+
   def __init__(self, item_type: type):
     self._items = []
     self.item_type = item_type
@@ -363,9 +437,11 @@ class ListLike:
 
   def __setitem__(self, index: int, item):
     self._items[index] = self._cast(item)
+    note_change()
 
   def __delitem__(self, index: int):
     del self._items[index]
+    note_change()
 
   def __len__(self):
     return len(self._items)
@@ -384,27 +460,35 @@ class ListLike:
 
   def append(self, item):
     self._items.append(self._cast(item))
+    note_change()
 
   def insert(self, index: int, item):
     self._items.insert(index, self._cast(item))
+    note_change()
 
   def extend(self, items):
-    if type(items) == type(self):
+    """Add the items from another instance of this class, or any iterable of items (which will be
+    cast to `item_type` if needed)."""
+    if isinstance(items, type(self)):
       self._items.extend(items._items)
-    elif type(items[0]) == self.item_type:
-      self._items.extend([self._cast(item) for item in items])
     else:
-      self_type = type(self).__name__
-      raise ValueError(
-        f'Argument to {self_type}.extend() must be either a {self_type} or a sequence of '
-        f'{self.item_type.__name__}s.'
-      )
+      self._items.extend(map(self._cast, items))
+    note_change()
 
 
 class CellGroup(ListLike):
 
+  __slots__ = ()
+
   def copy(self):
-    return type(self)(self, header=self.header)
+    """Make a shallow copy: the copy gets its own list of items, but the items themselves are shared.
+    The style is copied along with the other attributes of the group."""
+    copy = type(self).__new__(type(self))
+    copy._items = list(self._items)
+    copy.item_type = self.item_type
+    copy.header = self.header
+    copy.style = self._style.copy()
+    return copy
 
   def __repr__(self) -> str:
     class_name = type(self).__name__
@@ -417,19 +501,22 @@ class CellGroup(ListLike):
 
 class Rows(CellGroup, Styled):
 
+  __slots__ = ('header', '_style', '_html_cache')
+
   def __init__(self, raw_rows: RawRows=None, header=False, **kwargs: Mapping[str,Any]):
     super().__init__(Row)
     self._items: List[Row]
+    self._html_cache: Optional[Tuple[Tuple,str]] = None
     self.header = header
     self.init_style(kwargs)
     if not raw_rows:
       raw_rows = cast(RawRows, [])
-    elif isinstance(raw_rows[0], str) or not isinstance(raw_rows[0], collections.abc.Iterable):
-      # It's a single row.
+    elif isinstance(raw_rows[0], (str, dict, Cell)) or not hasattr(raw_rows[0], '__iter__'):
+      # It's a single row (its first element is a cell, not a row).
       raw_row = cast(RawRow, raw_rows)
       raw_rows = [raw_row]
-    for raw_row in raw_rows:
-      self.append(raw_row)
+    # Build the whole list at once instead of going through `append()` for each row.
+    self._items = [row if isinstance(row, Row) else Row(row) for row in raw_rows]
 
   def __str__(self) -> str:
     return '['+', '.join([str(row) for row in self])+']'
@@ -437,21 +524,26 @@ class Rows(CellGroup, Styled):
   def to_text(self, delim='\t', row_delim='\n') -> str:
     return row_delim.join([row.to_text(delim=delim) for row in self])
 
-  def to_html(self, indents=0, indent='  ') -> str:
-    html_lines = []
-    if self.header:
-      tag = 'thead'
-    else:
-      tag = 'tbody'
-    attr_str = self.style.to_attr_str()
-    html_lines.append(indent*indents+f'<{tag}{attr_str}>')
-    for row in self:
-      copy = row.copy()
-      if copy.header is None:
-        copy.header = self.header
-      html_lines.append(copy.to_html(indents=(indents+1), indent=indent))
-    html_lines.append(indent*indents+f'</{tag}>')
-    return '\n'.join(html_lines)
+  def copy(self) -> 'Rows':
+    copy = super().copy()
+    copy._html_cache = None
+    return copy
+
+  def _write_html(self, out: List[str], indents=0, indent='  ') -> None:
+    if not self.header:
+      write_rows_html(self, out, indent*indents, indent)
+      return
+    # Header sections tend to be re-rendered unchanged, so keep the last rendering until something
+    # changes. Note: this can't detect in-place modifications of the cells' `value` objects.
+    key = (CHANGE_VERSION, indents, indent)
+    if self._html_cache is not None and self._html_cache[0] == key:
+      out.append(self._html_cache[1])
+      return
+    section_out: List[str] = []
+    write_rows_html(self, section_out, indent*indents, indent)
+    html = ''.join(section_out)
+    object.__setattr__(self, '_html_cache', (key, html))
+    out.append(html)
 
   def deep_apply(self, **kwargs: Mapping[str,Any]) -> None:
     """Apply styles directly to every Cell."""
@@ -461,6 +553,8 @@ class Rows(CellGroup, Styled):
 
 class Row(CellGroup, Styled):
 
+  __slots__ = ('header', '_style')
+
   def __init__(self, raw_row: RawRow=None, header=None, **kwargs: Mapping[str,Any]):
     super().__init__(Cell)
     self._items: List[Cell]
@@ -468,8 +562,7 @@ class Row(CellGroup, Styled):
     self.init_style(kwargs)
     if not raw_row:
       raw_row = []
-    for raw_cell in raw_row:
-      self.append(raw_cell)
+    self._items = [cell if isinstance(cell, Cell) else Cell(cell) for cell in raw_row]
 
   def __str__(self) -> str:
     return '('+self.to_text(delim=', ')+')'
@@ -477,19 +570,13 @@ class Row(CellGroup, Styled):
   def to_text(self, delim='\t') -> str:
     return delim.join([str(cell) for cell in self])
 
-  def to_html(self, indents=0, indent='  ') -> str:
-    html_lines = []
-    attr_str = self.style.to_attr_str()
-    html_lines.append(indent*indents+f'<tr{attr_str}>')
-    for cell in self:
-      if self.header != cell.header:
-        final_cell = cell.copy()
-        final_cell.header = self.header
-      else:
-        final_cell = cell
-      html_lines.append(indent*(indents+1)+final_cell.to_html())
-    html_lines.append(indent*indents+'</tr>')
-    return '\n'.join(html_lines)
+  def _write_html(
+      self, out: List[str], indents=0, indent='  ', default_header: Optional[bool]=None
+    ) -> None:
+    """`default_header` is the `header` value to use if this row's own is `None` (i.e. the value of
+    the `Rows` it's in). The cells are all rendered with the row's `header` value."""
+    header = default_header if self.header is None else self.header
+    write_row_html(self, out, header, indent*indents, indent)
 
   def deep_apply(self, **kwargs: Mapping[str,Any]) -> None:
     """Apply styles directly to every Cell."""
@@ -499,14 +586,29 @@ class Row(CellGroup, Styled):
 
 class Cell(Styled):
 
+  __slots__ = ('value', 'width', 'height', 'header', '_style')
+
   ATTR_DEFAULTS = {'width':1, 'height':1, 'header':None}
 
   def __init__(self, raw_cell: Any=None, value: Any=None, **kwargs):
     if isinstance(raw_cell, type(self)):
       type(self).copy(raw_cell, self)
       return
+    if not kwargs and raw_cell is not None and (
+        type(raw_cell) in (str, int, float) or not isinstance(raw_cell, collections.abc.Mapping)
+      ):
+      # Fast path for the most common case: a bare value with no other settings.
+      self.value = raw_cell
+      self.width = 1
+      self.height = 1
+      self.header = None
+      if is_number(raw_cell):
+        self._style = NUMBER_STYLE
+      else:
+        self._style = DEFAULT_STYLE
+      return
     unused = self.init_all(kwargs)
-    if isinstance(raw_cell, collections.abc.Mapping):
+    if type(raw_cell) is dict or isinstance(raw_cell, collections.abc.Mapping):
       self.value = raw_cell.get('value')
       unused = self.init_all(raw_cell, ignore={'value'})
     elif raw_cell is None:
@@ -557,8 +659,11 @@ class Cell(Styled):
       copy.value = self.value.copy()
     else:
       copy.value = self.value
-    copy.style = self.style.copy()
-    copy.init_attrs(vars(self))
+    if self._style._shared:
+      copy.style = self._style
+    else:
+      copy.style = self._style.copy()
+    copy.init_attrs({attr:getattr(self, attr) for attr in self.ATTR_DEFAULTS})
     return copy
 
   #TODO:
@@ -573,10 +678,7 @@ class Cell(Styled):
       value = getattr(self, attr)
       if value != default:
         kwarg_strs.append(f'{attr}={value!r}')
-    for attr, metadata in Style.METADATA.items():
-      value = getattr(self, attr)
-      if value != metadata['default']:
-        kwarg_strs.append(f'{attr}={value!r}')
+    kwarg_strs.extend(self._style.get_nondefault_strs())
     kwarg_str = ', '.join(kwarg_strs)
     return f'{class_name}({kwarg_str})'
 
@@ -587,32 +689,36 @@ class Cell(Styled):
       return str(self.value)
 
   def to_html(self) -> str:
-    attributes = []
-    if self.header:
-      tag = 'th'
-      attributes.append('scope="col"')
-    else:
-      tag = 'td'
-    if self.width != 1:
-      attributes.append(f'colspan={self.width}')
-    if self.height != 1:
-      attributes.append(f'rowspan={self.height}')
-    style_str = str(self.style)
-    if style_str:
-      attributes.append(style_str)
-    if attributes:
-      attributes_html = ' '+' '.join(attributes)
-    else:
-      attributes_html = ''
+    if self.width == 1 and self.height == 1 and not self.header:
+      # Fast path for the most common shape: a plain `<td>` with no span attributes.
+      return '<td'+self._style.to_attr_str()+'>'+str(self.get_html_value())+'</td>'
+    out: List[str] = []
+    self._write_html(out)
+    return ''.join(out)
+
+  def _write_html(self, out: List[str]) -> None:
+    open_tag, close_tag = self.get_tags()
+    out.append(open_tag)
+    out.append(str(self.get_html_value()))
+    out.append(close_tag)
+
+  def get_html_value(self) -> Any:
     if self.value is None:
-      value = ''
+      return ''
     else:
-      value = self.value
-    return f'<{tag}{attributes_html}>{value}</{tag}>'
+      return self.value
+
+  def get_tags(self) -> Tuple[str,str]:
+    """Get the opening and closing tags of the cell, like `('<td colspan=2>', '</td>')`."""
+    return get_cell_tags(bool(self.header), self.width, self.height, str(self._style))
 
 
 class Style:
 
+  __slots__ = (
+    'align', 'font', 'size', 'bold', '_borders', '_css', '_shared', '_nondefault_strs', '__weakref__'
+  )
+
   METADATA: Dict[str,Dict[str,Any]] = {
     'align':  {'default':'left', 'type':str, 'css':'text-align'},
     'font':   {'default':None, 'type':str, 'css':'font-family'},
@@ -624,48 +730,114 @@ class Style:
 
   def __init__(self, **kwargs: Mapping[str,Any]):
     super().__init__()
-    for key, metadata in self.METADATA.items():
+    object.__setattr__(self, '_shared', False)
+    for key, default in STYLE_DEFAULTS:
       if key in kwargs:
-        setattr(self, key, kwargs[key])
-        del kwargs[key]
+        setattr(self, key, kwargs.pop(key))
       else:
-        setattr(self, key, metadata['default'])
+        setattr(self, key, default)
     invalid_attrs = [repr(key) for key in kwargs]
     if invalid_attrs:
       class_name = type(self).__name__
       raise AttributeError(f'Invalid attribute(s) for {class_name!r} object: '+', '.join(invalid_attrs))
 
+  @classmethod
+  def make(cls, **kwargs: Mapping[str,Any]) -> 'Style':
+    """Get a shared, read-only `Style` with the given values.
+    All requests for identical styles return the same object. `Styled` objects holding a shared
+    `Style` will copy it before modifying it."""
+    style = cls(**kwargs)
+    try:
+      key = style.get_key()
+      pooled = STYLE_POOL.get(key)
+    except TypeError:
+      # Unhashable values in the `css`.
+      return style
+    if pooled is not None:
+      return pooled
+    object.__setattr__(style, '_borders', frozenset(style._borders) or EMPTY_BORDERS)
+    object.__setattr__(style, '_css', types.MappingProxyType(style._css) if style._css else EMPTY_CSS)
+    object.__setattr__(style, '_shared', True)
+    # Shared styles can't change, so their `repr` strings only have to be worked out once.
+    object.__setattr__(style, '_nondefault_strs', tuple(style._find_nondefault_strs()))
+    STYLE_POOL[key] = style
+    return style
+
   def __setattr__(self, attr: str, raw_value: Any):
-    if attr not in self.METADATA:
-      raise AttributeError(f'{type(self).__name__!r} object has no attribute {attr!r}.')
+    # Unknown attributes are rejected by `__slots__`.
+    if self._shared:
+      raise AttributeError(f'Cannot modify a shared {type(self).__name__!r}. Use a copy() instead.')
     if attr == 'css':
-      value = Style.parse_css(raw_value)
+      attr = '_css'
+      css = Style.parse_css(raw_value)
+      value = TrackedDict(css) if css else EMPTY_CSS
     elif attr == 'borders':
-      value = Style.parse_borders(raw_value)
+      attr = '_borders'
+      borders = Style.parse_borders(raw_value)
+      value = TrackedSet(borders) if borders else EMPTY_BORDERS
     else:
       value = raw_value
     object.__setattr__(self, attr, value)
+    note_change()
+
+  @property
+  def borders(self) -> Set[str]:
+    # Copy-on-write: trade the shared empty default for a private set before handing it out.
+    # Shared styles keep their read-only containers.
+    if self._borders is EMPTY_BORDERS and not self._shared:
+      object.__setattr__(self, '_borders', TrackedSet())
+    return self._borders
+
+  @property
+  def css(self) -> Dict[str,Any]:
+    if self._css is EMPTY_CSS and not self._shared:
+      object.__setattr__(self, '_css', TrackedDict())
+    return self._css
+
+  def _get_stored(self, attr: str) -> Any:
+    """Read an attribute without the copy-on-write done by the `borders` and `css` getters."""
+    if attr == 'borders':
+      return self._borders
+    elif attr == 'css':
+      return self._css
+    return getattr(self, attr)
 
   def copy(self):
-    return type(self)(**vars(self))
+    return type(self)(**{key:self._get_stored(key) for key in STYLE_ATTRS})
 
   @staticmethod
   def parse_borders(value: Union[str,Iterable,None]) -> Set[str]:
     borders = set()
-    if isinstance(value, str):
+    value_type = type(value)
+    if value is None:
+      pass
+    elif value_type is str or isinstance(value, str):
       borders.add(value)
-    elif isinstance(value, collections.abc.Iterable):
+    elif (value_type in (set, frozenset, TrackedSet, list, tuple)
+        or isinstance(value, collections.abc.Iterable)):
       # A `set` is an iterable too.
       borders = set(value)
-    elif value is not None:
+    else:
       raise ValueError(f"'borders' must be a `str` or sequence of `str`s. Saw: {value!r}")
     return borders
 
   @staticmethod
   def parse_css(value: Union[str,Mapping,Iterable,None]) -> Dict[str,Any]:
     css = {}
-    if isinstance(value, str):
+    # Try the common concrete types first, falling back to the slower `abc` checks for the rest.
+    value_type = type(value)
+    if value is None:
+      pass
+    elif value_type is dict or value_type is TrackedDict:
+      css = dict(value)
+    elif value_type is str or isinstance(value, str):
       for statement in value.split(';'):
+        # Allow a trailing semicolon, as in `'padding: 1px;'`.
+        if statement and not statement.isspace():
+          key, value = Style.parse_css_statement(statement)
+          css[key] = value
+    elif value_type in (list, tuple):
+      for statement in value:
         key, value = Style.parse_css_statement(statement)
         css[key] = value
     elif isinstance(value, collections.abc.Mapping):
@@ -674,59 +846,257 @@ class Style:
       for statement in value:
         key, value = Style.parse_css_statement(statement)
         css[key] = value
-    elif value is not None:
+    else:
       raise ValueError(f"'css' must be a `str`, sequence of `str`, or a mapping. Saw: {value!r}")
     return css
 
   @staticmethod
   def parse_css_statement(statement: str) -> Tuple[str,str]:
-    try:
-      key, value = statement.split(':')
-    except ValueError as error:
-      error.args = (f'Invalid CSS statement: {statement!r}',)
-      raise error
+    # Only split on the first colon: values can contain them too, like `url(https://...)`.
+    key, sep, value = statement.partition(':')
+    if not sep:
+      raise ValueError(f'Invalid CSS statement: {statement!r}')
     return key.strip(), value.strip()
 
-  def __repr__(self) -> str:
+  def get_nondefault_strs(self) -> List[str]:
+    """Get `key=value` strings for every attribute that differs from its default.
+    Shared by the `__repr__`s of `Style` and the objects that carry one."""
+    if self._shared:
+      return list(self._nondefault_strs)
+    return self._find_nondefault_strs()
+
+  def _find_nondefault_strs(self) -> List[str]:
     attr_strs = []
-    for key, metadata in self.METADATA.items():
-      value = getattr(self, key)
-      if value != metadata['default']:
+    for key, default in STYLE_DEFAULTS:
+      value = self._get_stored(key)
+      if value != default:
+        if self._shared and key in ('borders', 'css'):
+          # Show the read-only containers of shared styles like normal ones.
+          value = type(default)(value)
         attr_strs.append(f'{key}={value!r}')
+    return attr_strs
+
+  def __repr__(self) -> str:
+    attr_strs = self.get_nondefault_strs()
     class_name = type(self).__name__
     return f'{class_name}({", ".join(attr_strs)})'
 
   def __str__(self) -> str:
-    css = dict(self.css)
-    for key, metadata in self.METADATA.items():
-      if not hasattr(self, key) or key == 'css':
-        continue
-      value = getattr(self, key)
-      if value is None:
-        continue
-      if 'css' in metadata:
-        css_property = metadata['css']
-        css[css_property] = value
-      elif key == 'bold':
-        if value is True:
-          css['font-weight'] = 'bold'
-        elif value is False:
-          css['font-weight'] = 'normal'
-      elif key == 'borders':
-        for border in value:
-          css[f'border-{border}'] = BORDER_STYLE
-    if css:
-      css_statements = [f'{key}: {value}' for key, value in css.items()]
-      return 'style="{}"'.format('; '.join(css_statements))
-    else:
-      return ''
+    return self._get_strs()[0]
 
   def to_attr_str(self) -> str:
-    style_str = str(self)
+    return self._get_strs()[1]
+
+  def get_key(self) -> Tuple:
+    """Get a hashable snapshot of the current values of the style.
+    Each value is paired with its type, since values like `True`, `1` and `1.0` are equal and hash
+    the same, but render differently."""
+    return (
+      type(self.align), self.align, type(self.font), self.font, type(self.size), self.size,
+      type(self.bold), self.bold, tuple(self._borders),
+      tuple((key, type(value), value) for key, value in self._css.items())
+    )
+
+  def _get_strs(self) -> Tuple[str,str]:
+    """Get the `style` attribute string and the version of it with a leading space.
+    Most tables reuse a handful of styles across many cells, so these are cached, keyed on the
+    style's values (not on the object, since `borders` and `css` can be modified in place)."""
+    try:
+      return STYLE_STRS[self.get_key()]
+    except KeyError:
+      key = self.get_key()
+    except TypeError:
+      # Unhashable values in the `css`.
+      key = None
+    style_str = format_style(self)
     if style_str:
-      return ' '+style_str
+      strs = (style_str, ' '+style_str)
     else:
-      return ''
+      strs = ('', '')
+    if key is not None:
+      if len(STYLE_STRS) >= MAX_STYLE_STRS:
+        STYLE_STRS.clear()
+      STYLE_STRS[key] = strs
+    return strs
+
+
+# Flattened views of `Style.METADATA`, for the loops that run once per object.
+STYLE_DEFAULTS: Tuple[Tuple[str,Any],...] = tuple(
+  (attr, metadata['default']) for attr, metadata in Style.METADATA.items()
+)
+STYLE_ATTRS = frozenset(Style.METADATA)
+
+
+def compile_style_formatter(metadata: Mapping[str,Mapping[str,Any]]) -> Callable[[Style],str]:
+  """Generate the function which renders a `Style` into a `style="..."` attribute string.
+  `Style.METADATA` is fixed, so instead of interpreting it on every call, this unrolls it once into
+  straight-line code. The generated function runs in this module's namespace."""
+  lines = ['def format_style(style):', '  css = dict(style._css)']
+  for key, attr_metadata in metadata.items():
+    if 'css' in attr_metadata:
+      lines.append(f'  if style.{key} is not None:')
+      lines.append(f'    css[{attr_metadata["css"]!r}] = style.{key}')
+    elif key == 'bold':
+      lines.append('  if style.bold is True:')
+      lines.append("    css['font-weight'] = 'bold'")
+      lines.append('  elif style.bold is False:')
+      lines.append("    css['font-weight'] = 'normal'")
+    elif key == 'borders':
+      lines.append('  for border in style._borders:')
+      lines.append("    css[f'border-{border}'] = BORDER_STYLE")
+  lines.append('  return format_css(css)')
+  namespace: Dict[str,Any] = {}
+  exec('\n'.join(lines), globals(), namespace)
+  return namespace['format_style']
+
+format_style = compile_style_formatter(Style.METADATA)
+
+
+def format_css(css: Mapping[str,Any]) -> str:
+  # Most styles only end up with one or two properties, so format those directly.
+  num_properties = len(css)
+  if num_properties == 0:
+    return ''
+  elif num_properties == 1:
+    (key, value), = css.items()
+    return f'style="{key}: {value}"'
+  elif num_properties == 2:
+    (key1, value1), (key2, value2) = css.items()
+    return f'style="{key1}: {value1}; {key2}: {value2}"'
+  else:
+    css_statements = [f'{key}: {value}' for key, value in css.items()]
+    return 'style="{}"'.format('; '.join(css_statements))
+
+
+def style_property(attr: str) -> property:
+  """Make a property which forwards `attr` to the object's `style`."""
+  if Style.METADATA[attr]['type'] in (set, dict):
+    # Mutable values have to go through the copy-on-write `style` getter.
+    def getter(self: Styled) -> Any:
+      return getattr(self.style, attr)
+  else:
+    def getter(self: Styled) -> Any:
+      return getattr(self._style, attr)
+  def setter(self: Styled, value: Any) -> None:
+    setattr(self.style, attr, value)
+  return property(getter, setter, doc=f'Shortcut for `style.{attr}`.')
+
+for attr in Style.METADATA:
+  setattr(Styled, attr, style_property(attr))
+
+
+@functools.lru_cache(maxsize=4096, typed=True)
+def get_cell_tags(header: bool, width: int, height: int, style_str: str) -> Tuple[str,str]:
+  """Build the opening and closing tags for a cell.
+  Many cells in a table share the same attributes, so the results are cached."""
+  if header:
+    open_tag, close_tag = '<th', '</th>'
+    attributes = ['scope="col"']
+  else:
+    open_tag, close_tag = '<td', '</td>'
+    attributes = []
+  if width != 1:
+    attributes.append(COLSPAN_ATTRS.get(width) or f'colspan={width}')
+  if height != 1:
+    attributes.append(ROWSPAN_ATTRS.get(height) or f'rowspan={height}')
+  if style_str:
+    attributes.append(style_str)
+  if attributes:
+    return open_tag+' '+' '.join(attributes)+'>', close_tag
+  else:
+    return open_tag+'>', close_tag
+
+
+def write_table_html(table: Table, out: List[str], indents=0, indent='  ') -> None:
+  """Render a whole `Table` in a single walk over its rows.
+  This does the work of the `Row` renderer inline, passing each section's `header` down to the rows
+  and cells instead of copying them to set it."""
+  table_prefix = indent*indents
+  out.append(table_prefix+'<table'+table._style.to_attr_str()+'>\n')
+  for section in table.header, table.body:
+    if section:
+      section._write_html(out, indents=(indents+1), indent=indent)
+      out.append('\n')
+  out.append(table_prefix+'</table>')
+
+
+def write_rows_html(rows: Rows, out: List[str], prefix: str, indent: str) -> None:
+  """Render a `<thead>` or `<tbody>`."""
+  row_prefix = prefix+indent
+  tag = 'thead' if rows.header else 'tbody'
+  out.append(prefix+'<'+tag+rows._style.to_attr_str()+'>\n')
+  for row in rows:
+    header = rows.header if row.header is None else row.header
+    write_row_html(row, out, header, row_prefix, indent)
+    out.append('\n')
+  out.append(prefix+'</'+tag+'>')
+
+
+def write_row_html(row: Row, out: List[str], header: Optional[bool], prefix: str, indent: str) -> None:
+  """Render a `<tr>`, treating all its cells as having the given `header` value."""
+  header = bool(header)
+  cell_tags = []
+  values = []
+  for cell in row:
+    cell_tags.append(get_cell_tags(header, cell.width, cell.height, str(cell._style)))
+    values.append(cell.get_html_value())
+  template = get_row_template(prefix, indent, row._style.to_attr_str(), tuple(cell_tags))
+  out.append(template.format(*values))
+
+
+def note_change() -> None:
+  """Record that something in a table changed, invalidating the caches keyed on `CHANGE_VERSION`."""
+  global CHANGE_VERSION
+  CHANGE_VERSION += 1
+
+
+def tracked_method(method: Callable) -> Callable:
+  """Wrap a method so that it calls `note_change()` first."""
+  @functools.wraps(method)
+  def wrapper(self, *args, **kwargs):
+    note_change()
+    return method(self, *args, **kwargs)
+  return wrapper
+
+for name in ('__setitem__', '__delitem__', '__ior__', 'clear', 'pop', 'popitem', 'setdefault', 'update'):
+  setattr(TrackedDict, name, tracked_method(getattr(dict, name)))
+for name in (
+    '__ior__', '__iand__', '__isub__', '__ixor__', 'add', 'clear', 'discard', 'pop', 'remove',
+    'update', 'difference_update', 'intersection_update', 'symmetric_difference_update'
+  ):
+  setattr(TrackedSet, name, tracked_method(getattr(set, name)))
+
+
+# Shared styles for objects with no style settings, and for cells with numeric values.
+DEFAULT_STYLE = Style.make()
+NUMBER_STYLE = Style.make(align='right')
+
+
+def get_row_template(
+    prefix: str, indent: str, attr_str: str, cell_tags: Tuple[Tuple[str,str],...]
+  ) -> str:
+  """Get a `str.format` template which renders a `<tr>` when given the values of its cells.
+  `cell_tags` is the opening and closing tags of each cell, from `Cell.get_tags()`.
+  The rows of a table usually share a handful of shapes, so the templates are cached."""
+  key = (prefix, indent, attr_str, cell_tags)
+  template = ROW_TEMPLATES.get(key)
+  if template is not None:
+    return template
+  cell_prefix = escape_braces(prefix+indent)
+  html_lines: List[Optional[str]] = [None] * (len(cell_tags)+2)
+  html_lines[0] = escape_braces(prefix+f'<tr{attr_str}>')
+  for i, (open_tag, close_tag) in enumerate(cell_tags, 1):
+    html_lines[i] = cell_prefix+escape_braces(open_tag)+'{}'+escape_braces(close_tag)
+  html_lines[-1] = escape_braces(prefix+'</tr>')
+  template = '\n'.join(html_lines)
+  if len(ROW_TEMPLATES) >= MAX_ROW_TEMPLATES:
+    ROW_TEMPLATES.clear()
+  ROW_TEMPLATES[key] = template
+  return template
+
+
+def escape_braces(string: str) -> str:
+  return string.replace('{', '{{').replace('}', '}}')
 
 
 def rotate_table(old_rows):
@@ -781,11 +1151,6 @@ def partially_order(unordered, order):
   return ordered
 
 
-import argparse
-import pathlib
-import sys
-import tempfile
-
 DESCRIPTION = """Create formatted tables from text input."""
 
 def make_argparser():
@@ -5,12 +5,41 @@ from __future__ import print_function
 import os
 import re
 import sys
+import time
 import errno
 import socket
+import struct
 import inspect
 import argparse
+import functools
+import ipaddress
 import subprocess
 import distutils.spawn
+import concurrent.futures
+try:
+  from pyroute2 import IPRoute, NetlinkError
+except ImportError:
+  IPRoute = None
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# The last ARP table read by get_arp_table(), and when and where it was read from.
+ARP_CACHE = {'time':0, 'path':None, 'table':None}
+ARP_CACHE_TTL = 5
+# Recent results from get_ip_socket(), mapping the 'to' address to the time and local ip.
+LOCAL_IP_CACHE = {}
+LOCAL_IP_CACHE_TTL = 2
+# Patterns for parsing command output.
+# This finds all three fields get_wifi_info() needs in one pass over iwconfig's output.
+IWCONFIG_REGEX = re.compile(
+  r'^(?P<iface>\S+)[ \t]+\S'
+  r'|(?i:access point: (?P<ap>[a-f0-9:]+))[ \t\r]*$'
+  r'|SSID:"(?P<ssid>.*)"[ \t\r]*$',
+  re.MULTILINE
+)
+IPV4_REGEX = re.compile(r'^[0-9\.]{7,15}$')
 
 
 def get_wifi_info():
@@ -23,40 +52,39 @@ def get_wifi_info():
   ssid = None
   mac = None
   interface = None
-  iwconfig_cmd = 'iwconfig'
-  # Check if iwconfig command is available. If not, fall back to the common absolute path
-  # /sbin/iwconfig. If this doesn't exist, subprocess will return an OSError anyway.
-  # Note: distutils.spawn.find_executable() fails with an exception if there is no $PATH defined.
-  # So we'll check first for that scenario. (I've actually seen this, for instance in the
-  # environment NetworkManager sets up for scripts in /etc/NetworkManager/dispatcher.d/.
-  if 'PATH' not in os.environ or not distutils.spawn.find_executable(iwconfig_cmd):
-    iwconfig_cmd = '/sbin/iwconfig'
+  iwconfig_cmd = find_command('iwconfig', '/sbin/iwconfig')
   # Call iwconfig.
-  devnull = open(os.devnull, 'w')
   try:
-    output = subprocess.check_output([iwconfig_cmd], encoding='utf8', stderr=devnull)
+    output = subprocess.check_output([iwconfig_cmd], encoding='utf8', stderr=subprocess.DEVNULL)
   except (OSError, subprocess.CalledProcessError):
     return (None, None, None)
-  finally:
-    devnull.close()
   # Parse ssid and mac from output.
-  for line in output.splitlines():
-    match = re.search(r'^(\S+)\s+\S', line)
-    if match:
-      interface = match.group(1)
-    if not mac:
-      match = re.search(r'^.*access point: ([a-fA-F0-9:]+)\s*$', line, re.I)
-      if match:
-        mac = match.group(1)
-    if not ssid:
-      match = re.search(r'^.*SSID:"(.*)"\s*$', line)
-      if match:
-        ssid = match.group(1)
+  for match in IWCONFIG_REGEX.finditer(output):
+    field = match.lastgroup
+    if field == 'iface':
+      interface = match.group('iface')
+    elif field == 'ap' and not mac:
+      mac = match.group('ap')
+    elif field == 'ssid' and not ssid:
+      ssid = match.group('ssid')
     if ssid is not None and mac is not None:
       break
   return (interface, ssid, mac)
 
 
+@functools.lru_cache(maxsize=None)
+def find_command(command, fallback):
+  """Check if 'command' is available on the $PATH. If not, return 'fallback', a common absolute
+  path for it. If that doesn't exist either, subprocess will raise an OSError anyway.
+  The result is cached, so the $PATH is only searched once per command."""
+  # Note: distutils.spawn.find_executable() fails with an exception if there is no $PATH defined.
+  # So we'll check first for that scenario. (I've actually seen this, for instance in the
+  # environment NetworkManager sets up for scripts in /etc/NetworkManager/dispatcher.d/.
+  if 'PATH' not in os.environ or not distutils.spawn.find_executable(command):
+    return fallback
+  return command
+
+
 def get_default_route(to='8.8.8.8'):
   """Determine the default networking interface in use at the moment by using the
   'ip route get' command.
@@ -64,21 +92,20 @@ def get_default_route(to='8.8.8.8'):
   By default, this is Google's 8.8.8.8. This differentiates between multiple
   default routes if there are any.
   Returns the name of the interface, and the IP of the default route. Or, on
-  error, returns (None, None)."""
+  error, returns (None, None).
+  If pyroute2 is installed, this asks the kernel directly over netlink instead of
+  running the 'ip' command."""
+  if IPRoute is not None:
+    return get_default_route_netlink(to)
   ip = None
   interface = None
-  ip_cmd = 'ip'
-  # Check if 'ip' command is available. If not, fall back to common absolute path.
-  if 'PATH' not in os.environ or not distutils.spawn.find_executable(ip_cmd):
-    ip_cmd = '/sbin/ip'
+  ip_cmd = find_command('ip', '/sbin/ip')
   # Call 'ip route get [ip]'.
-  devnull = open(os.devnull, 'w')
   try:
-    output = subprocess.check_output([ip_cmd, 'route', 'get', to], stderr=devnull)
+    output = subprocess.check_output([ip_cmd, 'route', 'get', to], encoding='utf8',
+                                     stderr=subprocess.DEVNULL)
   except (OSError, subprocess.CalledProcessError):
     return (None, None)
-  finally:
-    devnull.close()
   # Parse output.
   for line in output.splitlines():
     fields = line.rstrip('\r\n').split()
@@ -95,7 +122,7 @@ def get_default_route(to='8.8.8.8'):
       ip = fields[4]
       interface = fields[2]
     if ip is not None and interface is not None:
-      if re.search(r'^[0-9\.]{7,15}$', ip):
+      if IPV4_REGEX.search(ip):
         break
       else:
         ip = None
@@ -103,21 +130,35 @@ def get_default_route(to='8.8.8.8'):
   return (interface, ip)
 
 
-def dig_ip(domain):
-  """Use 'dig' command to get the first IP returned in a DNS query for 'domain'.
+def get_default_route_netlink(to='8.8.8.8'):
+  """Do the same as get_default_route(), but using pyroute2's netlink interface."""
+  try:
+    with IPRoute() as iproute:
+      routes = iproute.route('get', dst=to)
+      if not routes:
+        return (None, None)
+      ip = routes[0].get_attr('RTA_PREFSRC')
+      links = iproute.get_links(routes[0].get_attr('RTA_OIF'))
+  except (OSError, NetlinkError):
+    return (None, None)
+  if ip is None or not links:
+    return (None, None)
+  return (links[0].get_attr('IFLA_IFNAME'), ip)
+
+
+def dig_ip(domain, use_dig=False):
+  """Get the first IP returned in a DNS query for 'domain'.
+  This uses dns_query() unless 'use_dig' is True, in which case it runs the 'dig' command.
   On error, or no result, returns None."""
+  if not use_dig:
+    return dns_query(domain)
   ip = None
-  dig_cmd = 'dig'
-  if 'PATH' not in os.environ or not distutils.spawn.find_executable(dig_cmd):
-    dig_cmd = '/usr/bin/dig'
-  devnull = open(os.devnull, 'w')
+  dig_cmd = find_command('dig', '/usr/bin/dig')
   try:
     output = subprocess.check_output([dig_cmd, '+short', '+time=1', '+tries=2', domain],
-                                     stderr=devnull)
+                                     encoding='utf8', stderr=subprocess.DEVNULL)
   except (OSError, subprocess.CalledProcessError):
     return None
-  finally:
-    devnull.close()
   for line in output.splitlines():
     ip = line.strip()
     return ip
@@ -125,61 +166,96 @@ def dig_ip(domain):
 
 
 def dns_query(domain):
-  """Use the socket module to do a DNS query.
-  Returns None on failure instead of raising an exception (like socket.gaierror)."""
-  #TODO: Looks like getaddrinfo() is the preferred way?
+  """Use the socket module to do a DNS query for an IPv4 address.
+  Returns None on failure instead of raising an exception (like socket.gaierror).
+  Successful results are cached (see cached_dns_query())."""
   try:
-    return socket.gethostbyname(domain)
+    return cached_dns_query(domain)
   except socket.error:
     return None
 
 
-def get_arp_table(proc_path='/proc/net/arp'):
+def dns_query_many(domains, workers=32):
+  """Do dns_query() on many domains at once, in parallel threads.
+  Returns a dict mapping each domain to its IP (or None on failure)."""
+  # Dedupe, so identical domains aren't looked up concurrently by different threads.
+  unique_domains = list(dict.fromkeys(domains))
+  if not unique_domains:
+    return {}
+  with concurrent.futures.ThreadPoolExecutor(max_workers=int(workers)) as executor:
+    return dict(zip(unique_domains, executor.map(dns_query, unique_domains)))
+
+
+@functools.lru_cache(maxsize=1024)
+def cached_dns_query(domain):
+  """Do the lookup for dns_query(). Failures raise an exception, so they aren't cached."""
+  return socket.getaddrinfo(domain, None, socket.AF_INET)[0][4][0]
+
+
+def get_arp_table(proc_path='/proc/net/arp', force=False):
   """Get ARP table data from the /proc/net/arp pseudo-file.
   Returns a dict mapping IP addresses to ARP table entries. Each entry is a dict
   mapping field names to values. Fields: ip (str), hwtype (int), flags (int), mac
-  (str), mask (str), interface (str)."""
+  (str), mask (str), interface (str).
+  The data is reused for ARP_CACHE_TTL seconds, unless 'force' is True. Each call returns a new
+  copy of it, so callers can modify the result."""
+  table = get_shared_arp_table(proc_path=proc_path, force=force)
+  return {ip:dict(entry) for ip, entry in table.items()}
+
+
+def get_shared_arp_table(proc_path='/proc/net/arp', force=False):
+  """Like get_arp_table(), but return the cached table itself instead of a copy.
+  It's shared with every other caller, so don't modify it."""
+  now = time.monotonic()
+  if (not force and ARP_CACHE['path'] == proc_path and ARP_CACHE['table'] is not None
+      and now - ARP_CACHE['time'] < ARP_CACHE_TTL):
+    return ARP_CACHE['table']
   table = {}
-  header = True
+  # The file is small, so read it all at once.
   with open(proc_path) as arp_table:
-    for line in arp_table:
-      # Skip the header.
-      if header:
-        header = False
-        continue
-      # Assume the file is whitespace-delimited.
-      fields = line.rstrip('\r\n').split()
-      try:
-        ip, hwtype, flags, mac, mask, interface = fields
-      except ValueError:
-        continue
-      try:
-        mac = mac.upper()
-        hwtype = int(hwtype, 16)
-        flags = int(flags, 16)
-      except ValueError:
-        continue
-      table[ip] = {'ip':ip, 'hwtype':hwtype, 'flags':flags, 'mac':mac, 'mask':mask,
-                   'interface':interface}
+    lines = arp_table.read().splitlines()
+  # Skip the header.
+  for line in lines[1:]:
+    # Assume the file is whitespace-delimited.
+    fields = line.split()
+    if len(fields) != 6:
+      continue
+    ip, hwtype, flags, mac, mask, interface = fields
+    try:
+      hwtype = int(hwtype, 16)
+      flags = int(flags, 16)
+    except ValueError:
+      continue
+    table[ip] = {'ip':ip, 'hwtype':hwtype, 'flags':flags, 'mac':mac.upper(), 'mask':mask,
+                 'interface':interface}
+  ARP_CACHE['time'] = now
+  ARP_CACHE['path'] = proc_path
+  ARP_CACHE['table'] = table
   return table
 
 
 def get_mac_from_ip(ip):
   """Look up the MAC address of an IP on the LAN, using the /proc/net/arp pseudo-file.
   Returns None if the IP isn't found."""
-  arp_table = get_arp_table()
-  if ip in arp_table:
-    return arp_table[ip]['mac']
-  else:
+  entry = get_shared_arp_table().get(ip)
+  if entry is None:
     return None
-
-
-def get_ip_socket(to='8.8.8.8'):
-  """Get this machine's local IP address by creating a dummy socket to an external ip."""
-  sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-  sock.connect(('8.8.8.8', 53))
-  ip = sock.getsockname()[0]
-  sock.close()
+  else:
+    return entry['mac']
+
+
+def get_ip_socket(to='8.8.8.8', force=False):
+  """Get this machine's local IP address by creating a dummy socket to an external ip.
+  The result is reused for LOCAL_IP_CACHE_TTL seconds, unless 'force' is True."""
+  now = time.monotonic()
+  if not force and to in LOCAL_IP_CACHE:
+    last_time, ip = LOCAL_IP_CACHE[to]
+    if now - last_time < LOCAL_IP_CACHE_TTL:
+      return ip
+  with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+    sock.connect((to, 53))
+    ip = sock.getsockname()[0]
+  LOCAL_IP_CACHE[to] = (now, ip)
   return ip
 
 
@@ -192,46 +268,68 @@ def mask_ip(ip, prefix_len=None):
     upper, lower = mask_ip('104.39.72.0/22')
   Returns the lower and upper bounds of the ip range as strings.
   """
-  if prefix_len is None:
-    ip, prefix_len_str = ip.split('/')
-    prefix_len = int(prefix_len_str)
-  ip_bin = ip_to_bin(ip)
-  ip_int = int(ip_bin, 2)
-  mask_bin = '1' * prefix_len + '0' * (32-prefix_len)
-  mask_int = int(mask_bin, 2)
-  lower_bound_int = ip_int & mask_int
-  # Get the "opposite" of the mask (e.g. 11111000 -> 00000111, if IP addresses were 8 bits).
-  subnet_int = 0b11111111111111111111111111111111 ^ mask_int
-  upper_bound_int = lower_bound_int + subnet_int
-  lower_bound_str = int_to_ip(lower_bound_int)
-  upper_bound_str = int_to_ip(upper_bound_int)
-  return lower_bound_str, upper_bound_str
+  if prefix_len is not None:
+    ip = f'{ip}/{prefix_len}'
+  # strict=False allows host bits to be set in the ip (they're masked off).
+  network = ipaddress.ip_network(ip, strict=False)
+  return str(network.network_address), str(network.broadcast_address)
 
 
-def ip_to_bin(ip_str):
-  bin_str = ''
-  for byte_int_str in ip_str.split('.'):
-    byte_int = int(byte_int_str)
-    byte_bin_str = bin(byte_int)[2:]
-    byte_bin_str = pad_binary(byte_bin_str, 8)
-    bin_str += byte_bin_str
-  return bin_str
+def ip_to_int(ip_str):
+  """Convert a dotted-quad IPv4 address string to its 32-bit integer value."""
+  return struct.unpack('!I', socket.inet_aton(ip_str))[0]
 
 
 def int_to_ip(ip_int):
-  ip_bin = bin(ip_int)[2:]
-  ip_bin = pad_binary(ip_bin, 32)
-  return bin_to_ip(ip_bin)
+  """Convert a 32-bit integer to a dotted-quad IPv4 address string."""
+  return socket.inet_ntoa(struct.pack('!I', ip_int))
+
+
+def parse_ips(ip_strs):
+  """Convert many dotted-quad IPv4 address strings to a numpy array of 32-bit ints."""
+  require_numpy('parse_ips')
+  return octets_to_ints(b''.join([socket.inet_aton(ip_str) for ip_str in ip_strs]))
+
+
+def octets_to_ints(octets):
+  """Convert packed IPv4 addresses to a numpy array of 32-bit ints.
+  'octets' can be a bytes-like buffer of 4-byte, network-order addresses (like the raw
+  addresses in packet headers), or an N x 4 array of octets (one row per address)."""
+  require_numpy('octets_to_ints')
+  if isinstance(octets, (bytes, bytearray, memoryview)):
+    return numpy.frombuffer(octets, dtype='>u4').astype(numpy.uint32)
+  octets = numpy.asarray(octets, dtype=numpy.uint32).reshape(-1, 4)
+  return (octets[:,0] << 24) | (octets[:,1] << 16) | (octets[:,2] << 8) | octets[:,3]
+
+
+def format_ips(ip_ints):
+  """Convert an array of 32-bit ints to a list of dotted-quad IPv4 address strings."""
+  require_numpy('format_ips')
+  packed = numpy.asarray(ip_ints, dtype='>u4').tobytes()
+  return [socket.inet_ntoa(packed[i:i+4]) for i in range(0, len(packed), 4)]
+
+
+def mask_ips(ip_ints, prefix_len):
+  """Do mask_ip() on a whole array of ips (32-bit ints, as from parse_ips()) at once.
+  All use the same prefix length. Returns two arrays of ints: the lower and upper bounds."""
+  require_numpy('mask_ips')
+  mask = numpy.uint32((0xFFFFFFFF << (32-int(prefix_len))) & 0xFFFFFFFF)
+  lower_bounds = numpy.asarray(ip_ints, dtype=numpy.uint32) & mask
+  upper_bounds = lower_bounds | ~mask
+  return lower_bounds, upper_bounds
+
+
+def require_numpy(func_name):
+  if numpy is None:
+    raise ImportError(f'The "numpy" module is required for {func_name}().')
+
+
+def ip_to_bin(ip_str):
+  return pad_binary(bin(ip_to_int(ip_str))[2:], 32)
 
 
 def bin_to_ip(ip_bin):
-  ip_byte_strs = []
-  for i in range(0, 32, 8):
-    byte_bin_str = ip_bin[i:i+8]
-    byte_int = int(byte_bin_str, 2)
-    byte_int_str = str(byte_int)
-    ip_byte_strs.append(byte_int_str)
-  return '.'.join(ip_byte_strs)
+  return int_to_ip(int(ip_bin, 2))
 
 
 def pad_binary(bin_str, length):
@@ -295,32 +393,7 @@ def main(argv):
 def signature(func):
   """Take a function and return the call signature as a string, formatted just
   like the "def" line (minus the "def " before and ":" after)."""
-  argspec = inspect.getargspec(func)
-  allargs = argspec.args
-  lallargs = len(allargs)
-  defaults = argspec.defaults
-  if defaults is None:
-    lkwargs = 0
-  else:
-    lkwargs = len(defaults)
-  lposargs = lallargs - lkwargs
-  signature = func.__name__+'('
-  for (i, arg) in enumerate(allargs):
-    signature += arg
-    if i >= lposargs:
-      default = defaults[i - lposargs]
-      if isinstance(default, str):
-        signature += "='"+default+"'"
-      else:
-        signature += '='+str(default)
-    if i + 1 < lallargs:
-      signature += ', '
-  if argspec.varargs:
-    signature += ', *'+argspec.varargs
-  if argspec.keywords:
-    signature += ', **'+argspec.keywords
-  signature += ')'
-  return signature
+  return func.__name__+str(inspect.signature(func))
 
 
 def fail(message):
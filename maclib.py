@@ -1,15 +1,39 @@
 """Operations on MAC addresses."""
 import os
+import re
 import uuid
-import random
 import numbers
 import subprocess
 import distutils.spawn
 
+# Masks for the flag bits in the first byte of a 48-bit MAC address, and the broadcast address.
+LOCAL_BIT = 0b00000010 << 40
+MULTICAST_BIT = 0b00000001 << 40
+BROADCAST_MAC = 2**48 - 1
+# The hex string of every possible byte value, for formatting addresses without format() calls.
+HEX_BYTES = tuple('{:02X}'.format(i) for i in range(256))
+# A MAC address string: 6 colon-delimited hex bytes. Checked before int(), which accepts much more.
+MAC_REGEX = re.compile(r'[0-9A-Fa-f]{2}(:[0-9A-Fa-f]{2}){5}')
+# The last successful result of get_mac().
+MAC_CACHE = None
 
-def get_mac():
+
+def get_mac(force=False):
   """Get your own device's MAC address using uuid.getnode().
-  Returns a Mac object, or None on failure."""
+  Returns a Mac object, or None on failure.
+  A successful result is cached, unless 'force' is True. Failures aren't, so the next call tries
+  again."""
+  global MAC_CACHE
+  if MAC_CACHE is not None and not force:
+    return MAC_CACHE
+  mac = find_mac()
+  if mac is not None:
+    MAC_CACHE = mac
+  return mac
+
+
+def find_mac():
+  """Do the actual lookup for get_mac(), without the cache."""
   #TODO: uuid.getnode() arbitrarily chooses a MAC when the device has more than one. May have to use
   #      another method to make sure it's the MAC of the NIC in use. Probably have to create a
   #      dummy socket using a public IP.
@@ -18,7 +42,7 @@ def get_mac():
   # On failure, uuid.getnode() returns a random MAC, with the eight bit set:
   # https://docs.python.org/2/library/uuid.html#uuid.getnode
   # Check the eigth bit to determine whether it failed.
-  if uuid_mac.byte_ints[0] & 0b00000001:
+  if uuid_mac.is_multicast():
     # Try harder. (Use the "ip" command.)
     device = get_default_device()
     mac_str = get_mac_of_device(device)
@@ -67,102 +91,98 @@ def execute_cmd(cmd, bin_path=None):
 
 def get_random_mac():
   """Generate a valid, random MAC address."""
-  # In the first byte, the two least-significant bits must be 10:
-  # The 1 means it's a local MAC address (not globally assigned and unique).
-  # The 0 means it's not a broadcast address.
-  # https://superuser.com/questions/725467/set-mac-address-fails-rtnetlink-answers-cannot-assign-requested-address/725472#725472
-  # 0-63 * 4 gives a number with 00 as the last binary digits.
-  number = random.randint(0, 63) * 4
-  # Add the following 5 bytes.
-  for i in range(5):
-    number *= random.randint(0, 255)
-  return Mac(number)
+  return get_random_macs(1)[0]
+
+
+def get_random_macs(num):
+  """Generate a list of `num` valid, random MAC addresses.
+  This gets the random bytes for all of them at once."""
+  raw = os.urandom(6*num)
+  macs = []
+  for i in range(0, 6*num, 6):
+    mac_bytes = bytearray(raw[i:i+6])
+    # In the first byte, the two least-significant bits must be 10:
+    # The 1 means it's a local MAC address (not globally assigned and unique).
+    # The 0 means it's not a broadcast address.
+    # https://superuser.com/questions/725467/set-mac-address-fails-rtnetlink-answers-cannot-assign-requested-address/725472#725472
+    mac_bytes[0] = (mac_bytes[0] & 0b11111100) | 0b00000010
+    macs.append(Mac(int.from_bytes(mac_bytes, 'big')))
+  return macs
+
+
+def mac_to_eui64_int(number, middle=0xFFFE):
+  """Expand a 48-bit MAC address int to a 64-bit EUI-64 int by inserting `middle` as the middle two
+  bytes."""
+  return ((number & 0xFFFFFF000000) << 16) | (middle << 24) | (number & 0xFFFFFF)
 
 
 def eui64_to_mac(eui64):
   """Convert an EUI-64 to a MAC address by removing the middle two bytes."""
-  _bytes = eui64.split(':')
-  return Mac(_bytes[:3] + _bytes[5:])
+  number = int(eui64.replace(':', ''), 16)
+  return Mac(((number >> 40) << 24) | (number & 0xFFFFFF))
 
 
-# Subclass tuple to make Mac immutable.
-class Mac(tuple):
+class Mac:
   """An object representing a MAC address.
   Initialize with one argument: a MAC address in one of 4 representations:
     1. a string of the colon-delimited hexadecimal bytes
     2. an iterable of the bytes as hex strings
     3. an iterable of the bytes as integers
     4. a single integer representing the 48-bit value of the address
-  When a representation is requested that wasn't given initially, it is computed and cached.
+  Internally, the address is stored as the integer. The other representations are derived from it
+  when requested.
   Mac objects are immutable."""
 
-  # Need to override tuple's __new__().
-  def __new__(cls, mac):
-    return tuple.__new__(cls, ())
+  # The single slot keeps the per-object memory small, for when there are lots of them.
+  __slots__ = ('_number',)
 
   def __init__(self, mac):
-    self._string = None
-    self._number = None
-    self._bytes = None
-    self._byte_ints = None
-    if isinstance(mac, basestring):
-      assert len(mac) == 17, 'Mac string must be 17 characters (6 colon-delimited hex bytes).'
-      self._string = mac.upper()
+    if isinstance(mac, str):
+      assert MAC_REGEX.fullmatch(mac), 'Mac string must be 6 colon-delimited hex bytes.'
+      number = int(mac.replace(':', ''), 16)
     elif isinstance(mac, numbers.Integral):
-      self._number = mac
+      assert 0 <= mac < 2**48, 'Mac integer must be a 48-bit unsigned value.'
+      number = int(mac)
     else:
       try:
         _bytes = tuple(mac)
       except TypeError:
         raise AssertionError('Mac object must be initialized with a string, integer, or iterable.')
       assert len(_bytes) == 6, 'Mac must consist of 6 bytes.'
-      if isinstance(_bytes[0], basestring):
-        self._bytes = _bytes
+      if isinstance(_bytes[0], str):
+        byte_ints = [int(o, 16) for o in _bytes]
       elif isinstance(_bytes[0], numbers.Integral):
-        self._byte_ints = _bytes
+        byte_ints = _bytes
       else:
         raise AssertionError('Mac bytes must be numbers or strings.')
+      number = int.from_bytes(bytes(byte_ints), 'big')
+    object.__setattr__(self, '_number', number)
+
+  def __setattr__(self, attr, value):
+    raise AttributeError(f'{type(self).__name__!r} objects are immutable.')
+
+  def __reduce__(self):
+    return (type(self), (self._number,))
 
   @property
   def string(self):
-    """A string representing the MAC address as the standard colon-delimited hex bytes.
-    If it doesn't exist, derive it from the bytes."""
-    if self._string is None:
-      self._string = ':'.join(self.bytes)
-    return self._string
+    """A string representing the MAC address as the standard colon-delimited hex bytes."""
+    return ':'.join(self.bytes)
 
   @property
   def number(self):
-    """An int representing the MAC address value as a number.
-    If it doesn't exist, derive it from the bytes."""
-    if self._number is None:
-      hexadecimal = ''.join(self.bytes)
-      self._number = int(hexadecimal, 16)
+    """An int representing the MAC address value as a number."""
     return self._number
 
   @property
   def byte_ints(self):
-    """A tuple representing the MAC address as a series of bytes (ints).
-    If it doesn't exist, derive it from the bytes."""
-    if self._byte_ints is None:
-      self._byte_ints = tuple(int(o, 16) for o in self.bytes)
-    return self._byte_ints
+    """A tuple representing the MAC address as a series of bytes (ints)."""
+    return tuple(self._number.to_bytes(6, 'big'))
 
   @property
   def bytes(self):
-    """An tuple representing the MAC address as a series of hex bytes (strings).
-    If it doesn't exist, try deriving it from one of the other representations."""
-    if self._bytes is None:
-      if self._string is not None:
-        self._bytes = tuple(self._string.split(':'))
-      elif self._byte_ints is not None:
-        self._bytes = tuple('{:02X}'.format(o) for o in self._byte_ints)
-      elif self._number is not None:
-        hexadecimal = '{:012X}'.format(self._number)
-        self._bytes = tuple(hexadecimal[i:i+2] for i in range(0, 12, 2))
-      else:
-        raise AssertionError('Mac object is uninitialized.')
-    return self._bytes
+    """An tuple representing the MAC address as a series of hex bytes (strings)."""
+    return tuple([HEX_BYTES[o] for o in self._number.to_bytes(6, 'big')])
 
   def __str__(self):
     return self.string
@@ -171,10 +191,17 @@ class Mac(tuple):
     return "{}.{}('{}')".format(type(self).__module__, type(self).__name__, self.string)
 
   def __eq__(self, mac2):
-    return self.string == mac2.string
+    if not isinstance(mac2, Mac):
+      return NotImplemented
+    return self._number == mac2._number
 
   def __ne__(self, mac2):
-    return self.string != mac2.string
+    if not isinstance(mac2, Mac):
+      return NotImplemented
+    return self._number != mac2._number
+
+  def __hash__(self):
+    return hash(self._number)
 
   def to_eui64(self, is_mac48=False):
     """Convert the MAC address to an EUI-64 address.
@@ -183,34 +210,36 @@ class Mac(tuple):
     IPv6 address from a MAC address). If the MAC address should be considered a MAC-48 instead, so
     that 'FF:FF' is used as the middle bytes, set 'is_mac48' to True.
     N.B.: This is part 1 of how IPv6 generates addresses from MAC addresses. The second part is
-    flipping the locally administered bit."""
+    flipping the locally administered bit.
+    Returns the EUI-64 as a string of colon-delimited hex bytes."""
     if is_mac48:
-      middle = 'FF:FF'
+      middle = 0xFFFF
     else:
-      middle = 'FF:FE'
-    return self.bytes[:3] + middle + self.bytes[3:]
+      middle = 0xFFFE
+    eui64 = mac_to_eui64_int(self._number, middle)
+    return ':'.join([HEX_BYTES[o] for o in eui64.to_bytes(8, 'big')])
 
   def is_broadcast(self):
     """Check whether the MAC address is the broadcast FF:FF:FF:FF:FF:FF address."""
-    return self.string == 'FF:FF:FF:FF:FF:FF'
+    return self._number == BROADCAST_MAC
 
   def is_local(self):
     """Check whether the "locally administered" bit in a MAC address is set to 1."""
-    return bool(self.byte_ints[0] & 0b00000010)
+    return bool(self._number & LOCAL_BIT)
 
   def is_global(self):
     """Check whether the "locally administered" bit in a MAC address is set to 0.
     This means that the MAC address should be "globally unique"."""
-    return not bool(self.byte_ints[0] & 0b00000010)
+    return not self._number & LOCAL_BIT
 
   def is_multicast(self):
     """Check whether the "multicast" bit in a MAC address is set to 1."""
-    return bool(self.byte_ints[0] & 0b00000001)
+    return bool(self._number & MULTICAST_BIT)
 
   def is_unicast(self):
     """Check whether the "multicast" bit in a MAC address is set to 0.
     This means the MAC address is unicast."""
-    return not bool(self.byte_ints[0] & 0b00000001)
+    return not self._number & MULTICAST_BIT
 
   def is_normal(self):
     """Check whether the MAC address is the common type used by networking hardware.
@@ -228,28 +257,16 @@ class Mac(tuple):
 
   def to_local(self):
     """Set the "locally administered" bit to 1 and return the result."""
-    byte_ints = list(self.byte_ints)
-    # OR the first byte with 00000010.
-    byte_ints[0] = byte_ints[0] | 0b00000010
-    return Mac(byte_ints)
+    return Mac(self._number | LOCAL_BIT)
 
   def to_global(self):
     """Set the "locally administered" bit to 0 and return the result."""
-    byte_ints = list(self.byte_ints)
-    # AND the first byte with 11111101.
-    byte_ints[0] = byte_ints[0] & 0b11111101
-    return Mac(byte_ints)
+    return Mac(self._number & ~LOCAL_BIT)
 
   def to_multicast(self):
     """Set the "multicast" bit to 1 and return the result."""
-    byte_ints = list(self.byte_ints)
-    # OR the first byte with 00000001.
-    byte_ints[0] = byte_ints[0] | 0b00000001
-    return Mac(byte_ints)
+    return Mac(self._number | MULTICAST_BIT)
 
   def to_unicast(self):
     """Set the "multicast" bit to 0 and return the result."""
-    byte_ints = list(self.byte_ints)
-    # AND the first byte with 11111110.
-    byte_ints[0] = byte_ints[0] & 0b11111110
-    return Mac(byte_ints)
+    return Mac(self._number & ~MULTICAST_BIT)
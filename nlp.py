@@ -1,5 +1,8 @@
 #!/usr/bin/env python3
 import argparse
+import collections
+import functools
+import itertools
 import logging
 import string
 import sys
@@ -42,28 +45,28 @@ def main(argv):
 
 
 def get_words(input_str):
-  words = []
-  for word in input_str.lower().split():
-    clean_word = word.strip(string.punctuation)
-    if clean_word:
-      words.append(clean_word)
-  return words
+  # Only strip punctuation from the ends of words, so words like "it's" stay intact.
+  punctuation = string.punctuation
+  clean_words = [word.strip(punctuation) for word in input_str.lower().split()]
+  return [word for word in clean_words if word]
+
+
+@functools.lru_cache(maxsize=8192)
+def get_word_tuple(input_str):
+  """A cached version of get_words(), for strings which get compared repeatedly."""
+  return tuple(get_words(input_str))
+
+
+@functools.lru_cache(maxsize=8192)
+def get_word_set(input_str):
+  """The unique words in a string, cached like get_word_tuple()."""
+  return frozenset(get_word_tuple(input_str))
 
 
 def get_word_uniqueness(string_list):
-  total_count = 0
-  word_counts = {}
-  for s in string_list:
-    for word in get_words(s):
-      total_count += 1
-      try:
-        word_counts[word] += 1
-      except KeyError:
-        word_counts[word] = 1
-  uniqueness = {}
-  for word, count in word_counts.items():
-    uniqueness[word] = total_count/count
-  return uniqueness
+  word_counts = collections.Counter(itertools.chain.from_iterable(map(get_word_tuple, string_list)))
+  total_count = sum(word_counts.values())
+  return {word:total_count/count for word, count in word_counts.items()}
 
 
 def get_max_uniqueness(uniqueness):
@@ -75,9 +78,8 @@ def get_max_uniqueness(uniqueness):
 
 
 def score_words(words, uniqueness, weight_length=False):
-  score = 0
-  for word in words:
-    score += uniqueness.get(word, 0)
+  get_uniqueness = uniqueness.get
+  score = sum([get_uniqueness(word, 0) for word in words])
   if weight_length:
     weight = 1 + (len(words)-1)/7.5
     return score * weight
@@ -97,14 +99,15 @@ def get_word_similarity(str1, str2, uniqueness=None):
   """Score the similarity of two strings by how many words they have in common.
   The score is the number of words they share over the total number of unique words in both strings.
   """
-  words1 = set(get_words(str1))
-  words2 = set(get_words(str2))
+  words1 = get_word_set(str1)
+  words2 = get_word_set(str2)
+  assert words1 or words2, (str1, str2)
   overlap = words1 & words2
-  all_words = words1 | words2
-  assert all_words, (str1, str2)
   if uniqueness is None:
-    return len(overlap)/len(all_words)
+    # The size of the union is all that's needed, so skip building it.
+    return len(overlap)/(len(words1) + len(words2) - len(overlap))
   # Weight by uniqueness of each word.
+  all_words = words1 | words2
   overlap_score = score_words(overlap, uniqueness)
   all_words_score = score_words(all_words, uniqueness)
   return overlap_score/all_words_score
@@ -120,59 +123,73 @@ def get_word_similarity(str1, str2, uniqueness=None):
 def get_longest_word_substring(str1, str2, uniqueness=None):
   str2_index = {}
   # Build index of str2.
-  words2 = get_words(str2)
+  words2 = get_word_tuple(str2)
   for i, word in enumerate(words2):
     try:
       str2_index[word].append(i)
     except KeyError:
       str2_index[word] = [i]
   # Find longest substring. Each substring is a list of indices into words2.
-  substrings = []
+  # The running substrings are stored by the index of the word in words2 which would continue them.
+  # Two dicts are reused for this, swapping each word, instead of making a new one every time.
+  active = {}
+  new_active = {}
   longest_substring = []
-  words1 = get_words(str1)
-  for i, word in enumerate(words1):
-    # print('Word {:2d}: {!r}'.format(i, word))
+  longest_score = None
+  words1 = get_word_tuple(str1)
+  # How many words in a row (ending at the previous word) were found in str2.
+  run = 0
+  for pos, word in enumerate(words1):
+    if not uniqueness and len(longest_substring) >= run + len(words1) - pos:
+      # Even the running substrings couldn't get longer than the longest one by the end of str1.
+      break
     # Find all instances of this word in str2.
     if word in str2_index:
-      new_substrings = []
+      run += 1
       for i in str2_index[word]:
-        hit = False
-        # print('Found instance of {!r} in str2: {} ({!r})'.format(word, i, words2[i]))
-        for substring in substrings:
-          # print('Testing if {!r} continues {}'.format(word, [words2[x] for x in substring]))
-          if i == substring[-1] + 1:
-            # Match! The substring continues.
-            # print('Match! ({} == {} + 1)'.format(i, substring[-1]))
-            hit = True
-            substring.append(i)
-            new_substrings.append(substring)
-          else:
-            # Miss! End of this substring, unless another occurrence of the word continues it.
-            # print('Miss!  ({} != {} + 1)'.format(i, substring[-1]))
-            pass
-        if not hit:
+        substring = active.get(i)
+        if substring is None:
           # If this word didn't extend any other substring, start a new one.
-          new_substrings.append([i])
-          # print('Starting new substring: [{!r}]'.format(words2[i]))
-      # Before throwing away the old list, check if it contained any record-breaking substrings.
-      longest_substring = get_new_longest_substring(words2, substrings, longest_substring, uniqueness)
-      substrings = new_substrings
+          substring = [i]
+        else:
+          # Match! The substring continues.
+          substring.append(i)
+        new_active[i+1] = substring
+      # Before throwing away the old substrings, check if any were record-breaking.
+      # The ones that didn't continue end here.
+      longest_substring, longest_score = get_new_longest_substring(
+        words2, active.values(), longest_substring, uniqueness, longest_score
+      )
+      active, new_active = new_active, active
+      new_active.clear()
     else:
       # Miss! End of all running substrings.
-      # print('Miss! (not in str2)')
       # Check if we've found a new longest one, then delete the rest.
-      longest_substring = get_new_longest_substring(words2, substrings, longest_substring, uniqueness)
-      substrings = []
-  longest_substring = get_new_longest_substring(words2, substrings, longest_substring, uniqueness)
+      longest_substring, longest_score = get_new_longest_substring(
+        words2, active.values(), longest_substring, uniqueness, longest_score
+      )
+      active.clear()
+      run = 0
+  longest_substring, longest_score = get_new_longest_substring(
+    words2, active.values(), longest_substring, uniqueness, longest_score
+  )
   # print('Result:')
   # print([words2[x] for x in longest_substring])
   return [words2[x] for x in longest_substring]
 
 
-def get_new_longest_substring(words, substrings, longest_substring, uniqueness=None):
+def get_new_longest_substring(words, substrings, longest_substring, uniqueness=None,
+                              longest_score=None):
+  """Check whether any of the `substrings` beats the `longest_substring` so far.
+  Returns the winner and its score, for passing back in as `longest_score` on the next call.
+  The score is a `(length, score)` pair, since the substring can grow after it's scored (it's only
+  used when weighting by `uniqueness`)."""
   if uniqueness:
-    substring_words = [words[i] for i in longest_substring]
-    longest_substring_score = score_words(substring_words, uniqueness, weight_length=True)
+    if longest_score is not None and longest_score[0] == len(longest_substring):
+      longest_substring_score = longest_score[1]
+    else:
+      substring_words = [words[i] for i in longest_substring]
+      longest_substring_score = score_words(substring_words, uniqueness, weight_length=True)
   for substring in substrings:
     if uniqueness:
       substring_words = [words[i] for i in substring]
@@ -186,7 +203,9 @@ def get_new_longest_substring(words, substrings, longest_substring, uniqueness=N
       if len(substring) > len(longest_substring):
         # print('Found new longest substring: {}'.format([words[i] for i in substring]))
         longest_substring = substring
-  return longest_substring
+  if uniqueness:
+    return longest_substring, (len(longest_substring), longest_substring_score)
+  return longest_substring, None
 
 
 def tone_down_logger():
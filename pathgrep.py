@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
 import argparse
+import functools
 import logging
 import os
 import pathlib
+import re
 import sys
 try:
   import yaml
 except ImportError:
   yaml = None
+# The C loader is much faster for big filter files, but only exists if libyaml was available.
+if yaml is None:
+  SafeLoader = None
+else:
+  SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 assert sys.version_info.major >= 3, 'Python 3 required'
 
+# On POSIX, paths are just bytes, so the input can be filtered without decoding it.
+BINARY_IO = os.name == 'posix'
+SEP_BYTES = os.fsencode(os.sep)
 ESCAPE_CHARS = {'\\0':'\x00', '\\t':'\t', '\\n':'\n', '\\r':'\r'}
 DESCRIPTION = """Filter files according to paths in them."""
 
@@ -77,13 +87,28 @@ def main(argv):
 
   parse_rules_args(filters, args.include, args.exclude, args.ext)
 
-  delim = ESCAPE_CHARS.get(args.delim)
-  for line in filter_input(args.infile, filters, args.fields, delim, 'raise'):
-    print(line, end='')
+  delim = ESCAPE_CHARS.get(args.delim, args.delim)
+  if BINARY_IO:
+    infile = getattr(args.infile, 'buffer', args.infile)
+    if delim is not None:
+      delim = os.fsencode(delim)
+    sys.stdout.flush()
+    output = sys.stdout.buffer
+  else:
+    infile = args.infile
+    output = sys.stdout
+  # Write straight to the (buffered) output instead of a print() per line. But when it's a terminal,
+  # flush every line so it still works as a live filter (e.g. on `tail -f`).
+  write = output.write
+  flush = sys.stdout.isatty()
+  for line in filter_input(infile, filters, args.fields, delim, 'raise', binary=BINARY_IO):
+    write(line)
+    if flush:
+      output.flush()
 
 
 def csv_int(csv_str):
-  return [int(value_str) for value_str in csv_str.split('.')]
+  return [int(value_str) for value_str in csv_str.split(',')]
 
 
 def parse_rules_args(filters, includes, excludes, exts):
@@ -120,25 +145,28 @@ def parse_ext_rule(filters, ext_args):
     filters[rule_type+'d']['ext'].append(ext.lstrip('.'))
 
 
-def filter_input(input, filters, fields, delim, error_handling):
+def filter_input(input, filters, fields, delim, error_handling, binary=False):
+  """Yield the lines from `input` which pass the `filters`.
+  If `binary`, `input` should yield `bytes` lines (and `delim` should be `bytes`)."""
+  include = make_include_func(filters, binary=binary)
   for line_num, line_raw in enumerate(input):
     paths = parse_line(line_raw, fields, delim, error_handling, line_num)
     if paths is None:
       continue
     for path in paths:
-      if include_path(path, filters):
+      if include(path):
         yield line_raw
         break
 
 
 def parse_line(line_raw, fields, delim, error_handling, line_num):
   if fields is None:
-    line = line_raw.rstrip('\r\n')
-    return (pathlib.Path(line),)
+    line = line_raw.rstrip(b'\r\n' if isinstance(line_raw, bytes) else '\r\n')
+    return (parse_path(line),)
   else:
     field_values = split_line(line_raw, delim)
     try:
-      return [pathlib.Path(field_values[field-1]) for field in fields]
+      return [parse_path(field_values[field-1]) for field in fields]
     except IndexError:
       if error_handling != 'silent':
         logging.warning('Warning: Field out of range in line {}.'.format(line_num+1))
@@ -147,8 +175,50 @@ def parse_line(line_raw, fields, delim, error_handling, line_num):
       return None
 
 
+def parse_path(path_str):
+  """Break a path string into the pieces needed to match it against criteria:
+  `(path_str, parts, suffixes)`.
+  This is a lightweight replacement for `pathlib.Path`, which is slow to create for every input.
+  It normalizes the path the same way (on POSIX): `path_str` is what `str(pathlib.Path(path_str))`
+  would give, `parts` is what `get_anchored_parts()` would give, and `suffixes` is the same as
+  `pathlib.Path.suffixes`.
+  `path_str` can also be `bytes`, in which case all the pieces will be `bytes` too."""
+  if isinstance(path_str, bytes):
+    sep, dot = SEP_BYTES, b'.'
+  else:
+    sep, dot = os.sep, '.'
+  if path_str.startswith(sep):
+    # Like pathlib, keep exactly two leading slashes, but collapse more than that to one.
+    if path_str.startswith(sep*2) and not path_str.startswith(sep*3):
+      anchor = sep*2
+    else:
+      anchor = sep
+  else:
+    anchor = path_str[:0]
+  elems = [elem for elem in path_str.split(sep) if elem and elem != dot]
+  if elems:
+    path_str = anchor+sep.join(elems)
+    name = elems[-1]
+  else:
+    path_str = anchor or dot
+    name = anchor[:0]
+  if name.endswith(dot):
+    suffixes = []
+  else:
+    suffixes = [dot+suffix for suffix in name.lstrip(dot).split(dot)[1:]]
+  return path_str, (anchor, *elems), suffixes
+
+
+def to_parsed_path(path):
+  """Make sure `path` is in the form given by `parse_path()` (it can also be a `pathlib.Path` or
+  `str`)."""
+  if isinstance(path, tuple):
+    return path
+  return parse_path(str(path))
+
+
 def split_line(line_raw, delim):
-  line = line_raw.rstrip('\r\n')
+  line = line_raw.rstrip(b'\r\n' if isinstance(line_raw, bytes) else '\r\n')
   if delim:
     return line.split(delim)
   else:
@@ -182,7 +252,7 @@ def make_blank_criteria():
 
 def parse_filters_file(filters_file):
   assert yaml is not None, 'yaml module required to parse filters file.'
-  filters_data = yaml.safe_load(filters_file)
+  filters_data = yaml.load(filters_file, Loader=SafeLoader)
   excluded, has_excluded = parse_criteria(filters_data.get('excluded', {}))
   included, has_included = parse_criteria(filters_data.get('included', {}))
   return {
@@ -193,7 +263,7 @@ def parse_filters_file(filters_file):
 
 def parse_criteria_file(criteria_file):
   assert yaml is not None, 'yaml module required to parse included/excluded files.'
-  criteria_data = yaml.safe_load(criteria_file)
+  criteria_data = yaml.load(criteria_file, Loader=SafeLoader)
   root_keys = make_blank_criteria().keys()
   if not any([key in criteria_data for key in root_keys]):
     raise AssertionError(
@@ -253,6 +323,77 @@ def abs_str_to_path(path_str):
   return pathlib.Path(path_str).expanduser()
 
 
+def compile_filters(filters, binary=False):
+  """Make a version of `filters` with the criteria converted by `compile_criteria()`."""
+  return {
+    'excluded':compile_criteria(filters['excluded'], binary=binary),
+    'has_excluded':filters['has_excluded'],
+    'included':compile_criteria(filters['included'], binary=binary),
+    'has_included':filters['has_included'],
+  }
+
+
+def compile_criteria(criteria, binary=False):
+  """Convert criteria from `make_blank_criteria()`/`parse_criteria()` into a form that can be
+  checked quickly against lots of paths.
+  Instead of lists of rules to walk through, the exact matches and extensions become sets, and the
+  recursive matches become tuples of path elements to compare against the start of each path.
+  Relative exact matches become tuples of path elements to compare against the end of each path.
+  Rules are checked shortest-first, since those match the most paths.
+  If `binary`, the rules are encoded to match paths parsed from `bytes`.
+  Already-compiled criteria are returned unchanged. Note: compiled criteria don't reflect any rules
+  added to the original afterward."""
+  if criteria.get('compiled'):
+    return criteria
+  exact = criteria['absolute']['exact'] + criteria['startswith']['exact']
+  recursive = criteria['absolute']['recursive'] + criteria['startswith']['recursive']
+  relative = criteria['relative']
+  if binary:
+    encode = os.fsencode
+  else:
+    encode = str
+  return {
+    'compiled':True,
+    'exact':frozenset([get_anchored_parts(path, binary) for path in exact]),
+    'recursive':prune_recursive_rules([get_anchored_parts(path, binary) for path in recursive]),
+    'relative':{
+      'exact':tuple(sorted(
+        {get_anchored_parts(path, binary)[1:] for path in relative['exact']}, key=len
+      )),
+      'recursive':tuple([
+        get_subpath_regex(encode(str(path)))
+        for path in sorted(set(relative['recursive']), key=lambda path: len(str(path)))
+      ]),
+    },
+    'ext':frozenset([encode('.'+ext.lstrip('.')) for ext in criteria['ext']]),
+  }
+
+
+def prune_recursive_rules(rules):
+  """Sort recursive rules (tuples of anchored parts) shortest-first and drop any that are redundant.
+  A shorter rule covers more paths, so it's the likeliest to match and end the search early. And
+  once a rule is kept, any longer rule that starts with it can never be the first to match."""
+  pruned = []
+  for rule in sorted(set(rules), key=len):
+    if not any(rule[:len(kept)] == kept for kept in pruned):
+      pruned.append(rule)
+  return tuple(pruned)
+
+
+def get_anchored_parts(path, binary=False):
+  """Get the elements of a `pathlib.Path`, starting with its anchor (`''` for relative paths).
+  `path.relative_to(query)` works exactly when the query's anchored parts start the path's.
+  Two paths are equal exactly when their anchored parts are.
+  If `binary`, the elements are encoded to `bytes`."""
+  if path.anchor:
+    parts = path.parts
+  else:
+    parts = ('',)+path.parts
+  if binary:
+    return tuple([os.fsencode(part) for part in parts])
+  return parts
+
+
 def include_path(path, filters, default=None):
   """Check which filters the path matches, and decide whether it should be included.
   If there are only exclude rules, this will be default to inclusion.
@@ -271,6 +412,25 @@ def include_path(path, filters, default=None):
   return default
 
 
+def make_include_func(filters, binary=False):
+  """Make a function that does what `include_path()` does for the given `filters`, but with the
+  checks of which kinds of rules exist done up front instead of on every path.
+  If `binary`, the function takes paths parsed from `bytes`."""
+  filters = compile_filters(filters, binary=binary)
+  excluded = filters['excluded']
+  included = filters['included']
+  if filters['has_excluded'] and filters['has_included']:
+    return lambda path: (
+      not path_matches_criteria(path, excluded) and path_matches_criteria(path, included)
+    )
+  elif filters['has_excluded']:
+    return lambda path: not path_matches_criteria(path, excluded)
+  elif filters['has_included']:
+    return lambda path: path_matches_criteria(path, included)
+  else:
+    return lambda path: False
+
+
 def paths_match_criteria(paths, criteria):
   for path in paths:
     if path_matches_criteria(path, criteria):
@@ -279,42 +439,30 @@ def paths_match_criteria(paths, criteria):
 
 
 def path_matches_criteria(path, criteria):
-  # absolute
+  criteria = compile_criteria(criteria)
+  path_str, parts, suffixes = to_parsed_path(path)
+  # absolute and startswith
   #   exact
-  for query_path in criteria['absolute']['exact']:
-    if query_path == path:
-      return True
+  if parts in criteria['exact']:
+    return True
   #   recursive
-  for query_path in criteria['absolute']['recursive']:
-    try:
-      path.relative_to(query_path)
+  for query_parts in criteria['recursive']:
+    if parts[:len(query_parts)] == query_parts:
       return True
-    except ValueError:
-      pass
   # relative
   #   exact
-  for query_path in criteria['relative']['exact']:
-    if str(path).endswith(str(query_path)):
-      return True
-  #   recursive
-  for query_path in criteria['relative']['recursive']:
-    if is_subpath(path, query_path):
-      return True
-  # startswith
-  #   exact
-  for query_path in criteria['startswith']['exact']:
-    if query_path == path:
+  for query_parts in criteria['relative']['exact']:
+    # Compare whole elements so 'oo/bar' doesn't match the end of 'foo/bar'.
+    if query_parts and parts[-len(query_parts):] == query_parts:
       return True
   #   recursive
-  for query_path in criteria['startswith']['recursive']:
-    try:
-      path.relative_to(query_path)
+  for query_regex in criteria['relative']['recursive']:
+    if query_regex.search(path_str):
       return True
-    except ValueError:
-      pass
   # ext
-  for ext in criteria['ext']:
-    if matches_extensions(path, ext):
+  if criteria['ext'] and suffixes:
+    # One set operation checks all the extension rules at once.
+    if not criteria['ext'].isdisjoint(get_extensions(suffixes)):
       return True
   return False
 
@@ -328,19 +476,24 @@ def is_subpath(target_path, query_path):
   is_subpath('/ab/cd/ef/gh', 'd/ef') == False
   is_subpath('/ab/cd/ef/gh', 'ab') == True
   is_subpath('/ab/cd/ef/gh', 'gh') == True
+  is_subpath('/abcd/cd', 'cd') == True
   """
-  query_str = str(query_path).lstrip(os.sep).rstrip(os.sep)
-  target_str = str(target_path)
-  try:
-    i = target_str.index(query_str)
-  except ValueError:
-    return False
-  starts_on_boundary = i == 0 or target_str[i-1] == os.sep
-  ends_on_boundary = i+len(query_str) == len(target_str) or target_str[i+len(query_str)] == os.sep
-  if starts_on_boundary and ends_on_boundary:
-    return True
+  return bool(get_subpath_regex(str(query_path)).search(str(target_path)))
+
+
+@functools.lru_cache(maxsize=None)
+def get_subpath_regex(query_str):
+  """Make a regex that finds the query path in another path, but only on directory boundaries.
+  There are only a few queries, but they're checked against every input line, so they're cached.
+  If `query_str` is `bytes`, the regex will be too."""
+  if isinstance(query_str, bytes):
+    sep = SEP_BYTES
+    template = b'(?:^|%s)%s(?:%s|$)'
   else:
-    return False
+    sep = os.sep
+    template = '(?:^|%s)%s(?:%s|$)'
+  query_str = query_str.lstrip(sep).rstrip(sep)
+  return re.compile(template % (re.escape(sep), re.escape(query_str), re.escape(sep)))
 
 
 def matches_extensions(target_path, query_ext):
@@ -352,11 +505,16 @@ def matches_extensions(target_path, query_ext):
   The dot prefix on `query_ext` is optional."""
   if not query_ext.startswith('.'):
     query_ext = '.'+query_ext
-  exts = target_path.suffixes
-  for i in range(len(exts)):
-    if query_ext == ''.join(exts[i:]):
-      return True
-  return False
+  return query_ext in get_extensions(target_path.suffixes)
+
+
+def get_extensions(suffixes):
+  """Get every possible extension length from a list of suffixes like `pathlib.Path.suffixes`.
+  E.g. `['.tar', '.gz']` -> `{'.tar.gz', '.gz'}`. Works on `bytes` suffixes too."""
+  if not suffixes:
+    return set()
+  empty = suffixes[0][:0]
+  return {empty.join(suffixes[i:]) for i in range(len(suffixes))}
 
 
 def fail(message):
@@ -1,58 +1,149 @@
 #!/usr/bin/env python3
 import argparse
+import calendar
+import collections
+import concurrent.futures
 import datetime
+import functools
+import html
 import http.client
+import itertools
 import logging
 import re
 import socket
 import sys
+import threading
 import time
 import urllib.parse
 import xml.etree.ElementTree
+# lxml is much faster at parsing big export files, but the standard library works too.
+try:
+  from lxml import etree
+except ImportError:
+  etree = xml.etree.ElementTree
 try:
   import requests
   import requests.exceptions
-  from bs4 import BeautifulSoup
 except ImportError:
   requests = None
+try:
+  from bs4 import BeautifulSoup
+except ImportError:
   BeautifulSoup = None
 
 # API documentation: https://pinboard.in/api
 # Get the auth token from https://pinboard.in/settings/password
 
 MAX_RESPONSE = 16384 # bytes
+CHUNK_SIZE = 1024 # posts
+FETCH_AHEAD = 4 # How many urls to fetch in the background.
+MAX_PAGE = 1048576 # bytes
+PAGE_CHUNK_SIZE = 8192
+# Comments and scripts are matched too, just so a <title> inside them gets skipped.
+TITLE_REGEX = re.compile(
+  r'<!--.*?-->|<script\b.*?</script\s*>|<title\b[^>]*>(.*?)</title\s*>', re.IGNORECASE | re.DOTALL
+)
+TITLE_START_REGEX = re.compile(r'<title\b', re.IGNORECASE)
 API_DOMAIN = 'api.pinboard.in'
-GET_API_PATH = '/v1/posts/get?auth_token={token}&url={url}'
-ADD_API_PATH = '/v1/posts/add?auth_token={token}&url={url}&description={title}&tags={tags}&replace=no'
-
-
+# Before Python 3.12, quote_plus() is slow enough that a lookup table of every byte's quoted form is
+# over twice as fast.
+if sys.version_info >= (3, 12):
+  QUOTE_TABLE = None
+else:
+  QUOTE_TABLE = [
+    chr(byte) if chr(byte).isascii() and (chr(byte).isalnum() or chr(byte) in '_.-~')
+    else '+' if byte == ord(' ')
+    else '%{:02X}'.format(byte)
+    for byte in range(256)
+  ]
+# The url and other parameters get appended to these.
+GET_API_PATH = '/v1/posts/get?auth_token={token}&url='
+ALL_API_PATH = '/v1/posts/all?auth_token={token}'
+ADD_API_PATH = '/v1/posts/add?auth_token={token}&url='
+
+
+@functools.lru_cache(maxsize=1024)
 def quote(string):
-  return urllib.parse.quote_plus(string)
+  """Cached, since each url gets quoted twice (to check for it, then to add it), and the same tags
+  get quoted for every bookmark.
+  Gives the same result as `urllib.parse.quote_plus()`."""
+  if QUOTE_TABLE is None:
+    return urllib.parse.quote_plus(string)
+  return ''.join([QUOTE_TABLE[byte] for byte in string.encode('utf8')])
 
 
 class ApiInterface(object):
 
   def __init__(self, auth_token):
     self.auth_token = auth_token
+    self._get_path_start = GET_API_PATH.format(token=auth_token)
+    self._add_path_start = ADD_API_PATH.format(token=auth_token)
+    self._conex = None
+    self._response = None
 
   def is_url_bookmarked(self, url):
     """Check if a url is already bookmarked."""
-    request_path = GET_API_PATH.format(token=self.auth_token, url=quote(url))
-    response = make_request(API_DOMAIN, request_path)
+    request_path = self._get_path_start+quote(url)
+    response = self.make_request(request_path)
     return check_response(response, 'get')
 
+  def get_bookmarked_urls(self):
+    """Get the set of all bookmarked urls in one request, instead of checking them one at a time.
+    Returns `None` on failure (e.g. when rate limited: this is only allowed every 5 minutes)."""
+    response = self.make_request(ALL_API_PATH.format(token=self.auth_token))
+    if response is None:
+      return None
+    elif response.status != 200:
+      logging.info('Received status {} when requesting all bookmarks.'.format(response.status))
+      response.read()
+      return None
+    urls = set()
+    try:
+      for event, element in etree.iterparse(response):
+        if element.tag == 'post':
+          urls.add(element.attrib.get('href'))
+          element.clear()
+    except etree.ParseError:
+      logging.info('Parsing error in response when requesting all bookmarks.')
+      return None
+    return urls
+
   def bookmark_url(self, url, title, tags=None):
     """Bookmark a url. Returns True on success, False otherwise."""
     if tags is None:
       tags_str = 'automated'
     else:
       tags_str = make_tags_str(tags)
-    request_path = ADD_API_PATH.format(token=self.auth_token, url=quote(url), title=quote(title),
-                                       tags=tags_str)
+    request_path = (
+      self._add_path_start+quote(url)+'&description='+quote(title)+'&tags='+tags_str+'&replace=no'
+    )
     logging.debug('https://'+API_DOMAIN+request_path)
-    response = make_request(API_DOMAIN, request_path)
+    response = self.make_request(request_path)
     return check_response(response, 'add')
 
+  def make_request(self, path):
+    """Send a GET request to the API, reusing the same connection for every request instead of
+    doing a new TLS handshake each time. If the server closed the connection since the last request,
+    reconnect and try once more. Returns `None` on failure."""
+    if self._conex is None:
+      self._conex = http.client.HTTPSConnection(API_DOMAIN)
+    elif self._response is not None and not self._response.isclosed():
+      # The last response wasn't read to the end, so the connection can't be reused.
+      self._conex.close()
+    for attempt in range(2):
+      try:
+        self._conex.request('GET', path)
+        self._response = self._conex.getresponse()
+        return self._response
+      except (http.client.BadStatusLine, ConnectionError):
+        # Most likely the server dropped the idle connection.
+        self._conex.close()
+        if attempt > 0:
+          return None
+      except (http.client.HTTPException, socket.gaierror):
+        self._conex.close()
+        return None
+
 
 def make_tags_str(tags):
   tags_strs = []
@@ -63,15 +154,6 @@ def make_tags_str(tags):
   return '+'.join(tags_strs)
 
 
-def make_request(domain, path):
-  try:
-    conex = http.client.HTTPSConnection(domain)
-    conex.request('GET', path)
-  except (http.client.HTTPException, socket.gaierror):
-    return None
-  return conex.getresponse()
-
-
 def check_response(response, request_type):
   if response is None:
     fail('Failure making HTTP request to Pinboard API.')
@@ -140,46 +222,90 @@ def parse_add_response(response_body):
 
 def parse_archive_file(archive_path, format, tz_offset=None):
   if format == 'xml':
-    tree = xml.etree.ElementTree.parse(archive_path)
-    return parse_bookmarks_xml(tree.getroot(), tz_offset=tz_offset)
+    return iterparse_bookmarks_xml(archive_path, tz_offset=tz_offset)
   else:
     raise ValueError('Invalid format "{}"'.format(format))
 
 
 def parse_archive_str(archive_str, format, tz_offset=None):
   if format == 'xml':
-    root = xml.etree.ElementTree.fromstring(archive_str)
+    if isinstance(archive_str, str):
+      # lxml refuses str input with an encoding declaration (which the exports have).
+      archive_str = archive_str.encode('utf8')
+    root = etree.fromstring(archive_str)
     return parse_bookmarks_xml(root, tz_offset=tz_offset)
   else:
     raise ValueError('Invalid format "{}"'.format(format))
 
 
 def parse_bookmarks_xml(root, tz_offset=None):
-  if tz_offset is None:
-    delta = datetime.datetime.now() - datetime.datetime.utcnow()
-    tz_offset = round(delta.total_seconds())
+  time_shift = get_time_shift(tz_offset)
   assert root.tag == 'posts', root.tag
   for post_element in root:
-    assert post_element.tag == 'post', post_element.tag
-    if post_element.attrib.get('extended') and post_element.attrib.get('description') == 'Twitter':
-      post = Tweet()
-      post.text = post_element.attrib.get('extended')
-    else:
-      post = Bookmark()
-      post.title = post_element.attrib.get('description')
-      if 'tag' in post_element.attrib:
-        post.tags = post_element.attrib['tag'].strip().split()
-    post.url = post_element.attrib.get('href')
-    if 'time' in post_element.attrib and tz_offset is not None:
-      timestamp_str = post_element.attrib['time']
-      # Note: The bookmark timestamps are in UTC.
-      # tz_offset has to be the difference (in seconds) between this machine's timezone and UTC.
-      dt = datetime.datetime.strptime(timestamp_str, '%Y-%m-%dT%H:%M:%SZ')
-      post.timestamp = int(dt.timestamp()) + tz_offset
-    yield post
+    yield parse_post_element(post_element, time_shift)
+
+
+def iterparse_bookmarks_xml(archive_path, tz_offset=None):
+  """Like `parse_bookmarks_xml()`, but read the file incrementally instead of loading the whole
+  tree first. Each `<post>` is discarded once it's been parsed, so memory use stays flat."""
+  time_shift = get_time_shift(tz_offset)
+  root = None
+  for event, element in etree.iterparse(archive_path, events=('start', 'end')):
+    if root is None:
+      root = element
+      assert root.tag == 'posts', root.tag
+    elif event == 'end' and element is not root:
+      yield parse_post_element(element, time_shift)
+      element.clear()
+      root.remove(element)
+
+
+def get_tz_offset():
+  delta = datetime.datetime.now() - datetime.datetime.utcnow()
+  return round(delta.total_seconds())
+
+
+def get_time_shift(tz_offset):
+  """How many seconds to add to the true (UTC) timestamps of posts.
+  `tz_offset` is meant to be the difference (in seconds) between this machine's timezone and UTC.
+  The timestamps used to be read as local times and then shifted by `tz_offset`, so give the same
+  result for any `tz_offset` (with the default, that's no shift)."""
+  if tz_offset is None:
+    return 0
+  return tz_offset - get_tz_offset()
+
+
+def parse_timestamp(timestamp_str):
+  """Convert a UTC time like '2019-05-31T14:03:22Z' to a unix timestamp.
+  The format is fixed, so slicing out the fields is much faster than `strptime()`, and
+  `calendar.timegm()` doesn't need any local timezone lookups."""
+  return calendar.timegm((
+    int(timestamp_str[0:4]), int(timestamp_str[5:7]), int(timestamp_str[8:10]),
+    int(timestamp_str[11:13]), int(timestamp_str[14:16]), int(timestamp_str[17:19]),
+  ))
+
+
+def parse_post_element(post_element, time_shift=0):
+  assert post_element.tag == 'post', post_element.tag
+  if post_element.attrib.get('extended') and post_element.attrib.get('description') == 'Twitter':
+    post = Tweet()
+    post.text = post_element.attrib.get('extended')
+  else:
+    post = Bookmark()
+    post.title = post_element.attrib.get('description')
+    if 'tag' in post_element.attrib:
+      post.tags = post_element.attrib['tag'].strip().split()
+  post.url = post_element.attrib.get('href')
+  if 'time' in post_element.attrib:
+    # Note: The bookmark timestamps are in UTC.
+    post.timestamp = parse_timestamp(post_element.attrib['time']) + time_shift
+  return post
 
 
 class Post(object):
+  # Archives can have a lot of posts, so skip the per-instance __dict__.
+  __slots__ = ('type', 'url', 'timestamp')
+
   def __init__(self, type, url=None, timestamp=None):
     self.type = type
     self.url = url
@@ -192,16 +318,23 @@ class Post(object):
 
 
 class Tweet(Post):
+  __slots__ = ('text',)
+
   def __init__(self, url=None, timestamp=None, text=None):
     super().__init__('tweet', url=url, timestamp=timestamp)
     self.text = text
 
 
 class Bookmark(Post):
-  def __init__(self, url=None, timestamp=None, title=None, tags=[]):
+  __slots__ = ('title', 'tags')
+
+  def __init__(self, url=None, timestamp=None, title=None, tags=None):
     super().__init__('bookmark', url=url, timestamp=timestamp)
     self.title = title
-    self.tags = tags
+    if tags is None:
+      self.tags = []
+    else:
+      self.tags = tags
 
 
 def make_argparser():
@@ -249,8 +382,8 @@ def main(argv):
   if args.command == 'read':
     read_archive(args.bookmarks)
   elif args.command == 'bookmark':
-    if requests is None or BeautifulSoup is None:
-      fail('Error: "requests" and "beautifulsoup4" modules are required for saving bookmarks.')
+    if requests is None:
+      fail('Error: "requests" module is required for saving bookmarks.')
     urls = read_urls(args.urls)
     tags = args.tags.split(',')
     save_bookmarks(urls, args.auth_token, tags=tags, simulate=args.simulate, pause=args.pause,
@@ -258,14 +391,25 @@ def main(argv):
 
 
 def read_archive(path):
-  for post in parse_archive_file(path, 'xml'):
-    print('{}: {}'.format(post.human_time(), post.url))
-    if post.type == 'tweet':
-      print(post.text)
-    elif post.type == 'bookmark':
-      print(post.title)
-      if post.tags:
-        print(', '.join(post.tags))
+  posts = parse_archive_file(path, 'xml')
+  # Write the output in chunks instead of several print()s per post.
+  write = sys.stdout.write
+  while True:
+    chunk = list(itertools.islice(posts, CHUNK_SIZE))
+    if not chunk:
+      break
+    write(''.join([format_post(post) for post in chunk]))
+
+
+def format_post(post):
+  lines = ['{}: {}'.format(post.human_time(), post.url)]
+  if post.type == 'tweet':
+    lines.append(str(post.text))
+  elif post.type == 'bookmark':
+    lines.append(str(post.title))
+    if post.tags:
+      lines.append(', '.join(post.tags))
+  return '\n'.join(lines)+'\n'
 
 
 def save_bookmarks(urls, auth_token, tags=('automated',), simulate=False, skip_dead_links=False,
@@ -274,59 +418,143 @@ def save_bookmarks(urls, auth_token, tags=('automated',), simulate=False, skip_d
     headers = {}
   else:
     headers = {'User-Agent': user_agent}
-  skipped = 0
-  existing = 0
-  bookmarked = 0
+  results = collections.Counter()
   api = ApiInterface(auth_token)
-  for url in urls:
-    time.sleep(pause)
-    if not simulate and api.is_url_bookmarked(url):
-      logging.warning('Already bookmarked: {}'.format(url))
-      existing += 1
-    else:
-      instance_headers = get_headers(headers, url)
-      try:
-        response = requests.get(url, timeout=6, headers=instance_headers)
-      except requests.exceptions.RequestException:
-        logging.error('Error making request to {}'.format(url))
-        logging.error('  Could not determine a title. Skipping bookmark..')
-        skipped += 1
-        continue
-      except AttributeError as error:
-        # Catching exception due to bug https://github.com/requests/requests/issues/3807
-        if error.args[0] == "'NoneType' object has no attribute 'readline'":
-          logging.error('Error making request to {}'.format(url))
-          logging.error("  The server sent a response requests couldn't handle. Skipping bookmark..")
-          skipped += 1
-          continue
-        else:
-          raise
-      if skip_dead_links and response.status_code >= 400:
-        logging.error('Error: Dead link (status {}): {}'.format(response.status_code, url))
-        logging.error('  Skipping bookmark..')
-        skipped += 1
-        continue
-      title = get_title(response.text)
-      if title:
-        logging.info('Found title {!r}'.format(title))
-      else:
-        logging.warning('No title found for {}'.format(url))
-        title = url
-      if simulate:
-        logging.info('Bookmarking simulated only for '+url)
-        bookmarked += 1
+  # Check for existing bookmarks locally if possible, instead of with an API call for every url.
+  known_urls = None
+  if not simulate:
+    known_urls = api.get_bookmarked_urls()
+    if known_urls is None:
+      logging.warning('Could not get the list of existing bookmarks. Checking each url instead.')
+  # Sessions, so connections to the same site can be reused. Each fetching thread gets its own.
+  sessions = ThreadSessions()
+  # The pages are fetched in the background while this thread makes the API calls. Those all stay in
+  # this thread, so they're still made one at a time, with the pause in between.
+  fetches = collections.deque()
+  # Urls which are still being fetched or saved, so repeats of them in the input can be skipped.
+  # They only go into `known_urls` once they're actually bookmarked, so a failed one can be retried.
+  in_flight = set()
+  def finish_next():
+    url, fetch = fetches.popleft()
+    result = finish_bookmark(api, url, fetch, tags, simulate, skip_dead_links, pause)
+    results[result] += 1
+    in_flight.discard(url)
+    if known_urls is not None and result == 'bookmarked':
+      known_urls.add(url)
+  with concurrent.futures.ThreadPoolExecutor(max_workers=FETCH_AHEAD) as executor:
+    for url in urls:
+      if url in in_flight:
+        already_bookmarked = True
+      elif known_urls is not None:
+        already_bookmarked = url in known_urls
       else:
         time.sleep(pause)
-        success = api.bookmark_url(url, title, tags=tags)
-        if success:
-          logging.info('Successfully bookmarked {}'.format(url))
-          bookmarked += 1
+        already_bookmarked = not simulate and api.is_url_bookmarked(url)
+      if already_bookmarked:
+        logging.warning('Already bookmarked: {}'.format(url))
+        results['existing'] += 1
+        continue
+      instance_headers = get_headers(headers, url)
+      fetch = executor.submit(fetch_page, sessions.get, url, instance_headers)
+      fetches.append((url, fetch))
+      in_flight.add(url)
+      if len(fetches) >= FETCH_AHEAD:
+        finish_next()
+    while fetches:
+      finish_next()
+  sessions.close()
   if simulate:
     adverb = 'Simulatedly'
   else:
     adverb = 'Successfully'
   logging.warning('{} {} bookmarked\n{} Already bookmarked\n{} Skipped due to errors.'
-                  .format(bookmarked, adverb, existing, skipped))
+                  .format(results['bookmarked'], adverb, results['existing'], results['skipped']))
+
+
+def finish_bookmark(api, url, fetch, tags, simulate, skip_dead_links, pause):
+  """Get the title from the fetched page and bookmark the url.
+  `fetch` is the `Future` for the `fetch_page()` call.
+  Returns 'bookmarked', 'skipped' (couldn't get the page), or 'failed' (the API call failed)."""
+  try:
+    response, html_str = fetch.result()
+  except requests.exceptions.RequestException:
+    logging.error('Error making request to {}'.format(url))
+    logging.error('  Could not determine a title. Skipping bookmark..')
+    return 'skipped'
+  except AttributeError as error:
+    # Catching exception due to bug https://github.com/requests/requests/issues/3807
+    if error.args[0] == "'NoneType' object has no attribute 'readline'":
+      logging.error('Error making request to {}'.format(url))
+      logging.error("  The server sent a response requests couldn't handle. Skipping bookmark..")
+      return 'skipped'
+    else:
+      raise
+  if skip_dead_links and response.status_code >= 400:
+    logging.error('Error: Dead link (status {}): {}'.format(response.status_code, url))
+    logging.error('  Skipping bookmark..')
+    return 'skipped'
+  title = get_title(html_str)
+  if title:
+    logging.info('Found title {!r}'.format(title))
+  else:
+    logging.warning('No title found for {}'.format(url))
+    title = url
+  if simulate:
+    logging.info('Bookmarking simulated only for '+url)
+    return 'bookmarked'
+  time.sleep(pause)
+  if api.bookmark_url(url, title, tags=tags):
+    logging.info('Successfully bookmarked {}'.format(url))
+    return 'bookmarked'
+  return 'failed'
+
+
+def fetch_page(get_session, url, headers):
+  """Request the url, but only download as much of the page as it takes to get the title.
+  `get_session` is called to get the `requests.Session` to use (like `ThreadSessions.get`).
+  Returns the response and the (decoded) part of the page that was read."""
+  with get_session().get(url, timeout=6, headers=headers, stream=True) as response:
+    chunks = []
+    size = 0
+    last_chunk = b''
+    for chunk in response.iter_content(PAGE_CHUNK_SIZE):
+      chunks.append(chunk)
+      size += len(chunk)
+      # Look at the end of the last chunk too, in case the tag is split between them.
+      window = (last_chunk[-8:]+chunk).lower()
+      if b'</title' in window or b'</head' in window or size >= MAX_PAGE:
+        break
+      last_chunk = chunk
+  content = b''.join(chunks)
+  try:
+    html_str = str(content, response.encoding or 'utf8', errors='replace')
+  except LookupError:
+    # Unknown encoding given by the server.
+    html_str = str(content, 'utf8', errors='replace')
+  return response, html_str
+
+
+class ThreadSessions(object):
+  """Give each thread its own requests.Session, made the first time it asks for one.
+  requests doesn't guarantee a Session is thread-safe (its cookies and connection pools are shared),
+  so the fetching threads can't all use one."""
+  def __init__(self):
+    self._local = threading.local()
+    self._sessions = []
+    self._lock = threading.Lock()
+  def get(self):
+    session = getattr(self._local, 'session', None)
+    if session is None:
+      session = self._local.session = requests.Session()
+      with self._lock:
+        self._sessions.append(session)
+    return session
+  def close(self):
+    """Close every thread's session. Only call this once the threads are done with them."""
+    with self._lock:
+      sessions, self._sessions = self._sessions, []
+    for session in sessions:
+      session.close()
 
 
 def get_headers(default_headers, url):
@@ -343,18 +571,29 @@ def get_headers(default_headers, url):
   return headers
 
 
-def get_title(html):
-  if html is None:
-    return None
-  soup = BeautifulSoup(html, 'html.parser')
-  if soup.title:
-    # Remove whitespace from the ends of the title string.
-    title = soup.title.text.strip()
-    # Replace runs of whitespace (including newlines, tabs, etc) with a single space.
-    title = re.sub(r'\s+', ' ', title)
-    return title
-  else:
+def get_title(html_str):
+  """Find the page title. A regex is enough for almost all pages, and it's much faster than parsing
+  the whole document. BeautifulSoup (if installed) is only used if there's a `<title` the regex
+  couldn't handle, like an unclosed one."""
+  if html_str is None:
     return None
+  title = None
+  for match in TITLE_REGEX.finditer(html_str):
+    if match.group(1) is not None:
+      title = html.unescape(match.group(1))
+      break
+  if title is None:
+    if BeautifulSoup is None or not TITLE_START_REGEX.search(html_str):
+      return None
+    soup = BeautifulSoup(html_str, 'html.parser')
+    if not soup.title:
+      return None
+    title = soup.title.text
+  # Remove whitespace from the ends of the title string.
+  title = title.strip()
+  # Replace runs of whitespace (including newlines, tabs, etc) with a single space.
+  title = re.sub(r'\s+', ' ', title)
+  return title
 
 
 def read_urls(urls):
@@ -363,8 +602,14 @@ def read_urls(urls):
   elif urls.startswith('http://') or urls.startswith('https://'):
     return [urls]
   else:
-    with open(urls) as urls_file:
-      return (line.rstrip('\r\n') for line in urls_file)
+    return read_lines_path(urls)
+
+
+def read_lines_path(path):
+  # Open the file in here so it stays open until the generator is done with it.
+  with open(path) as lines_file:
+    for line in lines_file:
+      yield line.rstrip('\r\n')
 
 
 def fail(message):
@@ -1,5 +1,6 @@
 """A wrapper for textwrap, to simplify its usage and add an important capability."""
 # This should currently be compatible with Python 2.7 and 3.
+import re
 import textwrap
 try:
   import console
@@ -8,6 +9,9 @@ except ImportError:
 __version__ = '0.10'
 
 DEFAULT_WIDTH = 70
+CACHE_SIZE = 256
+# Whitespace textwrap changes (besides spaces).
+SPECIAL_WHITESPACE_REGEX = re.compile(r'[\t\n\x0b\x0c\r]')
 
 def wrap(text, width=None, width_mod=None, indent=0, lspace=0, **kwargs):
   """Take any input text and return output where no line is longer than "width".
@@ -46,6 +50,8 @@ class Wrapper(object):
   certain attributes after creation."""
 
   def __init__(self, width=None, width_mod=None, indent=0, lspace=0, **kwargs):
+    # Wrapped versions of lines seen before. Cleared whenever the settings change.
+    self._cache = {}
     self._textwrapper = textwrap.TextWrapper(**kwargs)
     if width is None:
       self.width = console.termwidth(DEFAULT_WIDTH)
@@ -73,8 +79,33 @@ class Wrapper(object):
       self.indent = indent
     # do wrapping
     wrapped = []
+    cache = self._cache
+    textwrapper = self._textwrapper
+    initial_indent = textwrapper.initial_indent
+    # Lines that already fit can skip textwrap. This is how much room they have.
+    room = textwrapper.width - len(initial_indent)
+    simple = not textwrapper.fix_sentence_endings
     for line in text.splitlines():
-      wrapped_lines = self._textwrapper.wrap(line)
+      if not line:
+        wrapped.append('')
+        continue
+      if simple and len(line) <= room and not SPECIAL_WHITESPACE_REGEX.search(line):
+        # textwrap would only drop the trailing spaces (and only if drop_whitespace).
+        if textwrapper.drop_whitespace:
+          line_out = line.rstrip(' ')
+        else:
+          line_out = line
+        # Leave any other trailing whitespace (e.g. non-breaking spaces) to textwrap.
+        if line_out and not line_out[-1].isspace():
+          wrapped.append(initial_indent+line_out)
+          continue
+      try:
+        wrapped_lines = cache[line]
+      except KeyError:
+        wrapped_lines = self._textwrapper.wrap(line)
+        if len(cache) >= CACHE_SIZE:
+          cache.clear()
+        cache[line] = wrapped_lines
       if wrapped_lines:
         wrapped.extend(wrapped_lines)
       else:
@@ -99,6 +130,7 @@ class Wrapper(object):
   def width(self, width):
     if width <= 0:
       width = 1
+    self._cache.clear()
     self._textwrapper.width = width
 
   @property
@@ -108,6 +140,7 @@ class Wrapper(object):
   def lspace(self, lspace):
     if lspace < 0:
       lspace = 0
+    self._cache.clear()
     # this order is important
     self._textwrapper.initial_indent = ' ' * (self.indent + lspace)
     self._textwrapper.subsequent_indent = ' ' * lspace
@@ -119,5 +152,6 @@ class Wrapper(object):
   def indent(self, indent):
     if indent + self.lspace < 0:
       indent = -self.lspace
+    self._cache.clear()
     self._textwrapper.initial_indent = ' ' * (indent + self.lspace)
 
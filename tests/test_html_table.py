@@ -0,0 +1,32 @@
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import html_table
+from html_table import Style
+
+
+class StyleKeyTest(unittest.TestCase):
+
+  def setUp(self):
+    html_table.STYLE_STRS.clear()
+
+  def test_bool_and_int_strs(self):
+    # `1 == True`, so these have to be told apart by type in the `STYLE_STRS` cache.
+    str(Style(bold=1))
+    self.assertIn('font-weight: bold', str(Style(bold=True)))
+
+  def test_int_and_float_strs(self):
+    str(Style(size=1.0))
+    self.assertEqual(str(Style(size=1)), 'style="text-align: left; font-size: 1"')
+
+  def test_bool_and_int_pool(self):
+    self.assertIsNot(Style.make(bold=1), Style.make(bold=True))
+    self.assertIsNot(Style.make(size=1), Style.make(size=1.0))
+    # Keep a reference, since the pool only holds weak ones.
+    style = Style.make(bold=True)
+    self.assertIs(Style.make(bold=True), style)
+
+
+if __name__ == '__main__':
+  unittest.main()
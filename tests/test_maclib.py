@@ -0,0 +1,25 @@
+import os
+import sys
+import unittest
+import warnings
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+with warnings.catch_warnings():
+  # maclib imports distutils, which is deprecated.
+  warnings.simplefilter('ignore', DeprecationWarning)
+  from maclib import Mac
+
+
+class MacStringTest(unittest.TestCase):
+
+  def test_valid(self):
+    self.assertEqual(str(Mac('aa:bb:cc:dd:ee:ff')), 'AA:BB:CC:DD:EE:FF')
+
+  def test_invalid(self):
+    # int() accepts all of these, so they have to be rejected before the conversion.
+    for mac in ('0x:bb:cc:dd:ee:ff', 'a_:bb:cc:dd:ee:ff', 'AABBCCDDEEFF12345', ' a:bb:cc:dd:ee:ff'):
+      with self.assertRaises(AssertionError):
+        Mac(mac)
+
+
+if __name__ == '__main__':
+  unittest.main()
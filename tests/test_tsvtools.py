@@ -0,0 +1,35 @@
+import io
+import os
+import sys
+import unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tsvtools
+
+
+class TableRowTest(unittest.TestCase):
+
+  def setUp(self):
+    self.table = tsvtools.read_tsv(io.StringIO('a\tb\n1\t2\n3\t4\n'))
+
+  def test_iter_write_through(self):
+    for row in self.table:
+      row['b'] = 'x'
+    self.assertEqual(self.table.columns['b'], ['x', 'x'])
+
+  def test_getitem_write_through(self):
+    self.table[0]['a'] = 'X'
+    self.table[-1]['a'] = 'Y'
+    self.assertEqual(self.table.columns['a'], ['X', 'Y'])
+
+  def test_row_is_dict_like(self):
+    row = self.table[1]
+    self.assertEqual(row, {'a':'3', 'b':'4'})
+    self.assertEqual(row.get('c'), None)
+    with self.assertRaises(KeyError):
+      row['c'] = '5'
+    with self.assertRaises(IndexError):
+      self.table[2]
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,40 +1,136 @@
 #!/usr/bin/env python
 from __future__ import division
+import sys
+import operator
+import itertools
+import collections
+try:
+  from collections.abc import MutableMapping
+except ImportError:
+  from collections import MutableMapping
+
+CHUNK_SIZE = 4096 # rows
+# Key values which count as null: a missing column, an empty string, or ".".
+NULL_VALUES = frozenset((None, '', '.'))
+
+
+class Table(object):
+  """A table stored column-wise: `columns` maps each column label to the list of its values.
+  It mostly works like the list of row dicts read_tsv() used to return: iterating over it yields a
+  TableRow for each row, mapping column labels to values, `table[i]` gives the TableRow for row
+  `i`, a slice gives a new Table of those rows, and it has append(), extend() and sort().
+  Setting a value in a TableRow changes the table. Rows given to append() or `table[i] =` must have
+  only the table's labels. Any that are missing get an empty string."""
+  def __init__(self, columns=None):
+    if columns is None:
+      columns = collections.OrderedDict()
+    self.columns = columns
+  def __len__(self):
+    for values in self.columns.values():
+      return len(values)
+    return 0
+  def __iter__(self):
+    for index in range(len(self)):
+      yield TableRow(self.columns, index)
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return Table(collections.OrderedDict(
+        (label, values[index]) for label, values in self.columns.items()
+      ))
+    index = operator.index(index)
+    if index < 0:
+      index += len(self)
+    if not 0 <= index < len(self):
+      raise IndexError('Table index out of range')
+    return TableRow(self.columns, index)
+  def __setitem__(self, index, row):
+    index = operator.index(index)
+    values = self._get_row_values(row)
+    for column, value in zip(self.columns.values(), values):
+      column[index] = value
+  def append(self, row):
+    values = self._get_row_values(row)
+    for column, value in zip(self.columns.values(), values):
+      column.append(value)
+  def extend(self, rows):
+    for row in rows:
+      self.append(row)
+  def sort(self, key=None, reverse=False):
+    """Sort the rows in place, like list.sort(). The `key` function is given each TableRow.
+    Afterward, existing TableRows refer to whatever row is now at their index."""
+    rows = list(self)
+    order = sorted(range(len(rows)), key=lambda i: rows[i] if key is None else key(rows[i]),
+                   reverse=reverse)
+    for values in self.columns.values():
+      values[:] = [values[i] for i in order]
+  def _get_row_values(self, row):
+    """Get the values of a row dict in column order, raising KeyError on unknown labels."""
+    unknown = [label for label in row if label not in self.columns]
+    if unknown:
+      raise KeyError('Row has labels not in the table: {}'.format(', '.join(map(repr, unknown))))
+    return [row.get(label, '') for label in self.columns]
+  def iter_tuples(self, name='Row'):
+    """Iterate over the rows as namedtuples instead of dicts, which are quicker to build and much
+    smaller. Labels that aren't valid field names (like "#chrom") get renamed to "_" plus their
+    column number, as in collections.namedtuple(rename=True)."""
+    Row = collections.namedtuple(name, list(self.columns.keys()), rename=True)
+    return map(Row._make, zip(*self.columns.values()))
+
+
+class TableRow(MutableMapping):
+  """A dict-like view of one row of a Table, by its index into the columns.
+  Setting a label's value writes it to the column. The labels themselves can't be changed, so
+  setting an unknown label raises KeyError and deleting one raises TypeError."""
+  __slots__ = ('columns', 'index')
+  def __init__(self, columns, index):
+    self.columns = columns
+    self.index = index
+  def __getitem__(self, label):
+    return self.columns[label][self.index]
+  def __setitem__(self, label, value):
+    self.columns[label][self.index] = value
+  def __delitem__(self, label):
+    raise TypeError("Can't delete a label from one row of a Table.")
+  def __iter__(self):
+    return iter(self.columns)
+  def __len__(self):
+    return len(self.columns)
+  def __repr__(self):
+    return '{}({!r})'.format(type(self).__name__, dict(self))
 
 
 def read_tsv(infile, labels=None):
-  """Read a tsv, returning a list of rows, each represented by a dict mapping
-  column labels to values. If no labels are given, the first line of the tsv is
-  assumed to be a header with the column labels. Starting #'s are not removed
-  from the header.
+  """Read a tsv, returning a Table. Iterating over it gives the rows, each represented by a dict
+  mapping column labels to values. If no labels are given, the first line of the tsv is assumed to
+  be a header with the column labels. Starting #'s are not removed from the header.
   Input argument is an opened file-like object (like a file or sys.stdin).
   Labels must be a list of label strings."""
-  # If labels were given, build mapping between them and column numbers.
-  columns = {}
-  if labels:
-    for (col, field) in enumerate(labels):
-      columns[field] = col
-    in_header = False
-  else:
-    in_header = True
-  rows = []
+  if not labels:
+    labels = None
+    for line in infile:
+      labels = line.rstrip('\r\n').split('\t')
+      break
+    if labels is None:
+      return Table()
+  # Build mapping between column labels and column numbers.
+  # If a label appears more than once, the last column with it wins.
+  columns = collections.OrderedDict()
+  for (col, field) in enumerate(labels):
+    columns[field] = col
+  table = Table(collections.OrderedDict((label, []) for label in columns))
+  column_lists = [(col, table.columns[label]) for label, col in columns.items()]
+  # Short rows get padded once, so the column loop needs no bounds checks.
+  num_cols = len(labels)
+  padding = [''] * num_cols
+  # str.split() already tokenizes in C. csv.reader and pandas.read_csv(dtype=str) both measured
+  # slower than this loop, and pandas can't read rows of varying length the same way.
   for line in infile:
-    # Build columns dict, mapping column labels to column numbers.
     fields = line.rstrip('\r\n').split('\t')
-    if in_header:
-      for (col, field) in enumerate(fields):
-        columns[field] = col
-      in_header = False
-      continue
-    # Build a dict for a row, mapping column labels to values.
-    row = {}
-    for label in columns:
-      try:
-        row[label] = fields[columns[label]]
-      except IndexError:
-        row[label] = ''
-    rows.append(row)
-  return rows
+    if len(fields) < num_cols:
+      fields += padding
+    for col, values in column_lists:
+      values.append(fields[col])
+  return table
 
 
 def table2dict(rows, key_label, key_label2=None):
@@ -44,16 +140,23 @@ def table2dict(rows, key_label, key_label2=None):
   empty string, or "."). If both are missing, the row is skipped.
   N.B.: The input table must use "key_label" as a unique key for each row!"""
   rowdict = {}
-  for row in rows:
-    # Try to get the value of the key column.
-    # If the column is not present or empty, try the alternative key column (key_label2) if it's
-    # given. If that doesn't work, silently skip the row.
-    key = row.get(key_label)
-    if key is None or key == '' or key == '.' and key_label2 is not None:
-      key = row.get(key_label2)
-      if key is None or key == '' or key == '.' and key_label2 is not None:
+  # Try to get the value of the key column.
+  # If it's null, try the alternative key column (key_label2) if it's given. If that doesn't work,
+  # silently skip the row.
+  if key_label2 is None:
+    for row in rows:
+      key = row.get(key_label)
+      if key in NULL_VALUES:
         continue
-    rowdict[key] = row
+      rowdict[key] = row
+  else:
+    for row in rows:
+      key = row.get(key_label)
+      if key in NULL_VALUES:
+        key = row.get(key_label2)
+        if key in NULL_VALUES:
+          continue
+      rowdict[key] = row
   return rowdict
 
 
@@ -62,64 +165,165 @@ def table2dictlist(rows, key_label, key_label2=None):
   "key_label" column to lists of rows with that value. If key_label2 is provided, that is used as
   an alternative key column to be used in the case where the first column is null (not present,
   empty string, or "."). If both are missing, the row is skipped."""
-  dictlist = {}
-  for row in rows:
-    # Try to get the value of the key column.
-    # If the column is not present or empty, try the alternative key column (key_label2) if it's
-    # given. If that doesn't work, silently skip the row.
-    key = row.get(key_label)
-    if key is None or key == '' or key == '.' and key_label2 is not None:
-      key = row.get(key_label2)
-      if key is None or key == '' or key == '.' and key_label2 is not None:
+  dictlist = collections.defaultdict(list)
+  # Try to get the value of the key column.
+  # If it's null, try the alternative key column (key_label2) if it's given. If that doesn't work,
+  # silently skip the row.
+  if key_label2 is None:
+    for row in rows:
+      key = row.get(key_label)
+      if key in NULL_VALUES:
         continue
-    rowlist = dictlist.get(key, [])
-    rowlist.append(row)
-    dictlist[key] = rowlist
+      dictlist[key].append(row)
+  else:
+    for row in rows:
+      key = row.get(key_label)
+      if key in NULL_VALUES:
+        key = row.get(key_label2)
+        if key in NULL_VALUES:
+          continue
+      dictlist[key].append(row)
+  # Go back to raising KeyError for missing keys, like a plain dict.
+  dictlist.default_factory = None
   return dictlist
 
 
-def join(table1, tableN, join_label):
+def join(table1, tableN, join_label, presorted=False):
   """Join two tables with a 1:N relationship on a field label "join_label".
   The tables must be in the format returned by read_tsv(). For one of the tables
-  ("table1"), the join column must be uniquely identifying.
+  ("table1"), the join column must be uniquely identifying. If it isn't, this raises a
+  ValueError (unless presorted=True).
   The result will not contain information from any rows in either table that do
-  not have a join value present in the other table."""
-  result = []
-  tableNdict = table2dictlist(tableN, join_label)
-  for row1 in table1:
-    try:
-      join_value = row1[join_label]
-    except KeyError:
+  not have a join value present in the other table. The result rows are in the order of their
+  rows in tableN.
+  If both tables are already sorted on "join_label", give presorted=True to use join_sorted()
+  instead, which doesn't build any lookup dict.
+  The result is a list of new row dicts. Use ijoin() to get them one at a time instead."""
+  return list(ijoin(table1, tableN, join_label, presorted=presorted))
+
+
+def ijoin(table1, tableN, join_label, presorted=False):
+  """Like join(), but yield the result rows one at a time instead of returning a list."""
+  if presorted:
+    for row in ijoin_sorted(table1, tableN, join_label):
+      yield row
+    return
+  # Build the hash table on table1, where each join value is only in one row, and stream tableN past
+  # it. A Table's index holds row numbers instead of rows, so only the rows that join get built.
+  table1dict = index_unique(table1, join_label)
+  table1_is_table = isinstance(table1, Table)
+  for row1, rowN in probe(tableN, join_label, table1dict):
+    if table1_is_table:
+      row1 = table1[row1]
+    merged = dict(rowN)
+    merged.update(row1)
+    yield merged
+
+
+def join_sorted(table1, tableN, join_label):
+  """Like join(), but for two tables which are both sorted (by plain string comparison, like
+  `LC_ALL=C sort`) on the "join_label" column. This merges the two in one pass over each, so
+  the tables can be any iterables of rows, like generators.
+  The result rows are in sorted order."""
+  return list(ijoin_sorted(table1, tableN, join_label))
+
+
+def ijoin_sorted(table1, tableN, join_label):
+  """Like join_sorted(), but yield the result rows one at a time instead of returning a list.
+  With generators as input, this only holds a couple rows in memory at once."""
+  rows1 = (row1 for row1 in table1 if row1.get(join_label) not in NULL_VALUES)
+  row1 = next(rows1, None)
+  for rowN in tableN:
+    join_value = rowN.get(join_label)
+    if join_value in NULL_VALUES:
       continue
-    try:
-      rowNlist = tableNdict[join_value]
-    except KeyError:
+    while row1 is not None and row1[join_label] < join_value:
+      row1 = next(rows1, None)
+    if row1 is None:
+      break
+    if row1[join_label] == join_value:
+      merged = dict(rowN)
+      merged.update(row1)
+      yield merged
+
+
+def index_unique(table, label):
+  """Map each non-null value in the `label` column of `table` to its row, raising ValueError if a
+  value is in more than one row. For a Table, map each value to its row number instead."""
+  if isinstance(table, Table):
+    values = table.columns.get(label, [])
+    index = dict(zip(values, range(len(values))))
+    num_nulls = 0
+    for null in NULL_VALUES:
+      num_nulls += values.count(null)
+      index.pop(null, None)
+    if len(index) < len(values) - num_nulls:
+      counts = collections.Counter(value for value in values if value not in NULL_VALUES)
+      value = counts.most_common(1)[0][0]
+      raise ValueError('Value {!r} is in more than one row of column {!r}.'.format(value, label))
+    return index
+  index = {}
+  for row in table:
+    value = row.get(label)
+    if value in NULL_VALUES:
       continue
-    for rowN in rowNlist:
-      #TODO: check if this modifies tableN
-      rowN.update(row1)
-      result.append(rowN)
-  return result
+    if value in index:
+      raise ValueError('Value {!r} is in more than one row of column {!r}.'.format(value, label))
+    index[value] = row
+  return index
+
+
+def probe(table, label, lookup):
+  """Look up each row of `table` in the dict `lookup` by its value in the `label` column.
+  Yield a (match, row) tuple for each row whose value is in `lookup`.
+  For a Table, this reads the column directly and only builds the dicts for matching rows."""
+  if isinstance(table, Table):
+    values = table.columns.get(label)
+    if values is None:
+      return
+    for i, value in enumerate(values):
+      match = lookup.get(value)
+      if match is not None:
+        yield match, table[i]
+  else:
+    for row in table:
+      match = lookup.get(row.get(label))
+      if match is not None:
+        yield match, row
 
 
 def row_dicts2row_lists(row_dicts, header=None):
   """Transform a table from a list of row dicts to a list of row lists.
   The header must be a list of lists, one list for every header line, each line
-  being a list of column labels."""
-  row_lists = []
-  for row_dict in row_dicts:
+  being a list of column labels. Without it, the columns are in the order of each dict's values.
+  A Table also works as the input, and is transposed straight from its columns."""
+  if isinstance(row_dicts, Table) and len(row_dicts):
     if header:
-      row_list = []
-      for label in header[0]:
-        row_list.append(row_dict[label])
-      row_lists.append(row_list)
+      columns = [row_dicts.columns[label] for label in header[0]]
     else:
-      row_lists.append(row_dict.values())
-  return row_lists
+      columns = list(row_dicts.columns.values())
+    # zip() can't tell how many rows there are when there are no columns.
+    if columns:
+      return list(map(list, zip(*columns)))
+  if header:
+    labels = header[0]
+    if len(labels) > 1:
+      # itemgetter() looks up all the labels in C, but it only returns a tuple for 2 or more.
+      get_values = operator.itemgetter(*labels)
+      return list(map(list, map(get_values, row_dicts)))
+    else:
+      return [[row_dict[label] for label in labels] for row_dict in row_dicts]
+  else:
+    return [list(row_dict.values()) for row_dict in row_dicts]
 
 
 def print_table(rows, header):
-  header_str = '\n'.join(map(lambda x: '\t'.join(x), header))
-  print header_str
-  for row in rows:
-    print '\t'.join(row)
+  write = sys.stdout.write
+  write('\n'.join(map('\t'.join, header))+'\n')
+  # Write the rows in chunks instead of one print per row.
+  rows = iter(rows)
+  while True:
+    chunk = list(itertools.islice(rows, CHUNK_SIZE))
+    if not chunk:
+      break
+    write('\n'.join(map('\t'.join, chunk))+'\n')
@@ -5,14 +5,15 @@ from __future__ import absolute_import
 from __future__ import unicode_literals
 import os
 import sys
-import argparse
+import functools
 import subprocess
-import collections
 PY3 = sys.version_info.major >= 3
 if PY3:
-  import configparser
+  _cache = functools.lru_cache(maxsize=None)
+  _DEVNULL = subprocess.DEVNULL
 else:
-  import ConfigParser as configparser
+  _cache = lambda func: func
+  _DEVNULL = open(os.devnull, 'w')
 
 # _SCRIPT_DIR is the parent directory of _THIS_DIR, the directory this script is in. Since this will
 # usually be included as a module in the "lib" submodule of a project, if we used this file's
@@ -25,27 +26,28 @@ _DEFAULT_CONFIG_FILENAME = 'VERSION'
 
 class Version(object):
   PRIMARY_KEYS = ('project', 'version_num', 'stage', 'commit')
+  __slots__ = PRIMARY_KEYS + ('_str',)
   def __init__(self, **kwargs):
+    self._str = None
     for key in self.PRIMARY_KEYS:
       setattr(self, key, kwargs.get(key, None))
+  def __setattr__(self, name, value):
+    object.__setattr__(self, name, value)
+    # Invalidate the cached version string.
+    if name in self.PRIMARY_KEYS:
+      object.__setattr__(self, '_str', None)
   @property
   def version(self):
     return str(self)
   def __str__(self):
-    version = ''
-    if self.version_num is None:
-      return version
-    else:
-      version += self.version_num
-    if self.stage is None:
-      return version
-    else:
-      version += '-' + self.stage
-    if self.commit is None:
-      return version
-    else:
-      version += '+' + self.commit
-    return version
+    if self._str is None:
+      parts = []
+      for prefix, value in (('', self.version_num), ('-', self.stage), ('+', self.commit)):
+        if value is None:
+          break
+        parts.append(prefix+value)
+      self._str = ''.join(parts)
+    return self._str
   def __repr__(self):
     class_name = type(self).__name__
     kwarg_list = ['{}={}'.format(key, getattr(self, key)) for key in self.PRIMARY_KEYS]
@@ -72,38 +74,26 @@ def get_version(config_path=None, repo_dir=None):
   return version
 
 
+@_cache
 def _get_git_commit(repo_dir=None):
-  """Get the current git commit of this script."""
-  # We have to cd to the repository directory because the --git-dir and --work-tree options don't
-  # work on BSD. BUT: actually, it looks like on recent versions (FreeBSD 11.0) it might work.
-  # Investigate.
+  """Get the current git commit of this script.
+  The result is cached, so git only runs once per repo_dir."""
+  # Run git from the repository directory instead of using --git-dir and --work-tree, which don't
+  # work on BSD. Passing it as the subprocess's cwd avoids changing our own working directory.
   if repo_dir is None:
     repo_dir = _SCRIPT_DIR
-  original_cwd = os.getcwd()
-  try:
-    if original_cwd != repo_dir:
-      os.chdir(repo_dir)
-    commit = _run_command(['git', 'log', '-n', '1', '--pretty=%h'], strip_newline=True)
-  except OSError:
-    return None
-  finally:
-    if original_cwd != os.getcwd():
-      os.chdir(original_cwd)
-  return commit
+  return _run_command(['git', 'log', '-n', '1', '--pretty=%h'], strip_newline=True, cwd=repo_dir)
 
 
-def _run_command(command, strip_newline=False):
-  devnull = open(os.devnull, 'w')
+def _run_command(command, strip_newline=False, cwd=None):
   try:
-    output = subprocess.check_output(command, stderr=devnull)
+    output = subprocess.check_output(command, stderr=_DEVNULL, cwd=cwd)
     exit_status = 0
   except subprocess.CalledProcessError as cpe:
     output = cpe.output
     exit_status = cpe.returncode
   except OSError:
     exit_status = None
-  finally:
-    devnull.close()
   if exit_status is None or exit_status != 0:
     return None
   elif strip_newline:
@@ -115,27 +105,71 @@ def _run_command(command, strip_newline=False):
     return output
 
 
+@_cache
 def _read_config(config_path):
-  """
-  Return None on failure."""
+  """Read the keys in the [version] section of a VERSION file.
+  The file is a simple INI file, so this parses just the subset of the format that ConfigParser
+  does which VERSION files use: [sections], "key = value" or "key: value" lines, indented
+  continuation lines, and whole-line # or ; comments. Keys are case-insensitive, and ones in a
+  [DEFAULT] section apply to [version] when it doesn't set them.
+  Return None on failure. The result is cached, so don't modify it."""
   KEYS = ('project', 'version_num', 'stage')
-  data = collections.defaultdict(lambda: None)
-  config = configparser.RawConfigParser()
+  # Read it as bytes and decode it ourselves, so it's UTF-8 regardless of the locale (and unicode on
+  # Python 2 too), without setting up a text layer for such a small file.
   try:
-    result = config.read(config_path)
-  except configparser.Error:
-    return None
-  if not result:
+    with open(config_path, 'rb') as config_file:
+      lines = config_file.read().decode('utf8').splitlines()
+  except (IOError, OSError, UnicodeDecodeError):
     return None
-  for key in KEYS:
-    try:
-      data[key] = config.get('version', key)
-    except configparser.Error:
-      pass
+  # Like ConfigParser, fail on duplicate sections or keys, lines before any section header, and
+  # lines without a delimiter or key.
+  seen = set()
+  # Values from the [DEFAULT] and [version] sections, keyed on (section, key).
+  values = {}
+  section = None
+  key = None
+  blank_lines = 0
+  for line in lines:
+    stripped = line.strip()
+    if not stripped:
+      blank_lines += 1
+      continue
+    if stripped[0] in '#;':
+      continue
+    if line[0].isspace() and key is not None:
+      # A continuation of the previous value. Blank lines in between are kept.
+      if (section, key) in values:
+        values[(section, key)] += '\n' * (blank_lines + 1) + stripped
+    elif stripped[0] == '[' and stripped[-1] == ']':
+      section = stripped[1:-1]
+      key = None
+      # [DEFAULT] may be repeated (its keys still may not be).
+      if section in seen and section != 'DEFAULT':
+        return None
+      seen.add(section)
+    else:
+      delim_indices = [i for i in (stripped.find('='), stripped.find(':')) if i >= 0]
+      if section is None or not delim_indices:
+        return None
+      delim_index = min(delim_indices)
+      key = stripped[:delim_index].strip().lower()
+      if not key or (section, key) in seen:
+        return None
+      seen.add((section, key))
+      if section in ('DEFAULT', 'version') and key in KEYS:
+        values[(section, key)] = stripped[delim_index+1:].strip()
+    blank_lines = 0
+  data = dict.fromkeys(KEYS)
+  # Like ConfigParser, the defaults only apply if there is a [version] section.
+  if 'version' in seen:
+    for key in KEYS:
+      data[key] = values.get(('version', key), values.get(('DEFAULT', key)))
   return data
 
 
 def _make_argparser():
+  # Only imported here, since this is usually used as a library and argparse is slow to import.
+  import argparse
   parser = argparse.ArgumentParser()
   parser.add_argument('-c', '--config-path', default=os.path.join(_THIS_DIR, _DEFAULT_CONFIG_FILENAME))
   parser.add_argument('-r', '--repo-dir', default=_THIS_DIR)
@@ -150,7 +184,10 @@ def _main(argv):
   args = parser.parse_args(argv[1:])
   if args.get_key:
     config = _read_config(args.config_path)
-    value = config[args.get_key]
+    if config is not None:
+      value = config.get(args.get_key)
+    else:
+      value = None
     if value:
       print(value)
   else: